@@ -0,0 +1,306 @@
+"""
+Offline replay benchmark for the assistant pipeline.
+
+Replays a corpus of commands through JarvisEngine with every external service
+replaced by a local stand-in: the stub recognizer, a fake Gemini model, local
+News and Wikipedia servers (stub_servers.py), a fake browser and no TTS.
+Reports turns per second, per-stage latency percentiles and memory use.
+
+    python bench_replay.py                        # built-in text corpus
+    python bench_replay.py corpus/ --repeat 5     # WAV files with .txt transcripts, or .txt command lists
+    python bench_replay.py --save-baseline baseline.json
+    python bench_replay.py --baseline baseline.json --max-regression 0.2   # exit code 1 on regression
+
+A WAV corpus is a directory of recordings, each with a sidecar transcript
+(turn_on_lights.wav + turn_on_lights.txt). The recordings go through the real
+audio stages (speech gate, preprocessing); the stub recognizer then answers
+with the sidecar transcript. Everything the run writes goes to a temporary
+home directory, so ~/.jarvis is left alone.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from time import perf_counter, sleep
+
+from stub_servers import StubNewsServer, StubWikipediaServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_COMMANDS = [
+    "what time is it",
+    "tell me a joke",
+    "what's the news",
+    "wikipedia moon",
+    "wikipedia albert einstein",
+    "explain how rainbows form",
+    "what is the largest planet in the solar system",
+    "read the news",
+    "search google for python tutorials",
+    "wikipedia python programming",
+]
+
+STAGE_SLACK_MS = 1.0  # Absolute p95 increase always tolerated, so sub-millisecond stages don't flap
+MEMORY_SLACK_MB = 1.0
+
+
+# --- Stand-ins ---
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Replaces genai.GenerativeModel: a canned reply, streamed one sentence per `latency` seconds."""
+    REPLY = ["Here is a short answer. ", "It comes from the fake model. ", "Nothing left this machine."]
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False):
+        self.calls += 1
+        if stream:
+            return self._stream()
+        sleep(self.latency * len(self.REPLY))
+        return FakeChunk("".join(self.REPLY))
+
+    def _stream(self):
+        for sentence in self.REPLY:
+            sleep(self.latency)
+            yield FakeChunk(sentence)
+
+
+class FakeDriver:
+    def __init__(self):
+        self.visited = []
+
+    def get(self, url):
+        self.visited.append(url)
+
+
+class FakeBrowser:
+    """Replaces BrowserSession: searches are recorded instead of opening Chrome."""
+    last_error = None
+
+    def __init__(self):
+        self.driver = FakeDriver()
+
+    def is_open(self):
+        return True
+
+    def is_starting(self):
+        return False
+
+    def should_prewarm_at_startup(self):
+        return False
+
+    def prewarm(self):
+        pass
+
+    def get(self):
+        return self.driver
+
+    def close(self):
+        pass
+
+
+# --- Corpus ---
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def load_corpus(path):
+    """Returns ("text", [command, ...]) or ("audio", [(wav_path, transcript), ...])."""
+    if path is None:
+        return "text", list(DEFAULT_COMMANDS)
+    if os.path.isfile(path):
+        return "text", read_lines(path)
+    recordings = sorted(glob.glob(os.path.join(path, "*.wav")))
+    if not recordings:
+        return "text", [line for name in sorted(glob.glob(os.path.join(path, "*.txt"))) for line in read_lines(name)]
+    items = []
+    for recording in recordings:
+        sidecar = os.path.splitext(recording)[0] + ".txt"
+        if not os.path.exists(sidecar):
+            sys.exit(f"Missing transcript {sidecar}")
+        items.append((recording, " ".join(read_lines(sidecar))))
+    return "audio", items
+
+
+def fingerprint(audio):
+    return hashlib.sha1(bytes(audio.frame_data)).hexdigest()
+
+
+def audio_transcripts(main, items):
+    """
+    Maps what the recognizer will receive for each recording (after the audio stages,
+    which are deterministic) to its transcript. Recordings the gate drops are left out.
+    """
+    stages = main.make_audio_stages()
+    recognizer = main.sr.Recognizer()
+    lookup = {}
+    for path, text in items:
+        with main.sr.AudioFile(path) as source:
+            audio = recognizer.record(source)
+        try:
+            for stage in stages:
+                audio = stage(audio)
+        except main.AudioRejected:
+            continue
+        lookup[fingerprint(audio)] = text
+    return lookup
+
+
+# --- Measurements ---
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2 ** 20
+
+
+def run_replay(main, kind, items, repeat, ai_latency, home):
+    """Runs one engine session over the corpus and returns the measurements."""
+    if kind == "audio":
+        lookup = audio_transcripts(main, items)
+
+        def transcribe(audio):
+            text = lookup.get(fingerprint(audio))
+            if text is None:
+                raise main.sr.UnknownValueError()
+            return text
+
+        backend = main.StubRecognizerBackend(transcribe)
+        source = main.AudioFileInput([path for path, _ in items] * repeat, backend)
+    else:
+        source = main.TextInput(items * repeat)
+
+    tracer = main.LatencyTracer(enabled=True, path=os.path.join(home, "latency.jsonl"))
+    engine = main.JarvisEngine(input_source=source, speech=None, tracer=tracer)
+    model = FakeGeminiModel(ai_latency)
+    engine.gemini_model = model
+    engine.browser = FakeBrowser()
+    commands = []
+    replies = []
+    engine.on("command", commands.append)
+    engine.on("reply", replies.append)
+
+    tracemalloc.start()
+    started = perf_counter()
+    engine.run()
+    elapsed = perf_counter() - started
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    engine.shutdown()
+
+    return {
+        "corpus": kind,
+        "turns": len(commands),
+        "replies": len(replies),
+        "seconds": round(elapsed, 3),
+        "turns_per_second": round(len(commands) / elapsed, 2) if elapsed else 0.0,
+        "stages": tracer.snapshot()["stages"],
+        "traced_peak_mb": round(traced_peak / 2 ** 20, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "gemini_calls": model.calls,
+        "searches": len(engine.browser.driver.visited),
+    }
+
+
+def compare(result, baseline, max_regression):
+    """Returns a list of regressions beyond max_regression (a fraction) against the baseline."""
+    problems = []
+    floor = baseline["turns_per_second"] * (1 - max_regression)
+    if result["turns_per_second"] < floor:
+        problems.append(f"throughput {result['turns_per_second']} turns/s < {floor:.2f} "
+                        f"(baseline {baseline['turns_per_second']})")
+    for stage, before in baseline.get("stages", {}).items():
+        now = result["stages"].get(stage)
+        if not now:
+            continue
+        limit = before["p95"] * (1 + max_regression) + STAGE_SLACK_MS
+        if now["p95"] > limit:
+            problems.append(f"{stage} p95 {now['p95']} ms > {limit:.1f} ms (baseline {before['p95']} ms)")
+    limit = baseline["traced_peak_mb"] * (1 + max_regression) + MEMORY_SLACK_MB
+    if result["traced_peak_mb"] > limit:
+        problems.append(f"traced memory peak {result['traced_peak_mb']} MB > {limit:.1f} MB "
+                        f"(baseline {baseline['traced_peak_mb']} MB)")
+    return problems
+
+
+def print_report(result):
+    print(f"\n{result['turns']} turns ({result['corpus']} corpus) in {result['seconds']:.2f} s "
+          f"-> {result['turns_per_second']} turns/s, {result['replies']} replies")
+    print(f"memory: traced peak {result['traced_peak_mb']} MB, process peak RSS {result['peak_rss_mb']} MB")
+    print(f"stand-ins: {result['gemini_calls']} Gemini calls, {result['news_requests']} news and "
+          f"{result['wikipedia_requests']} Wikipedia requests, {result['searches']} searches")
+    print("\nstage (ms)                 p50      p95      p99     n")
+    for stage, stats in sorted(result["stages"].items()):
+        print(f"  {stage:<22}{stats['p50']:>7}  {stats['p95']:>7}  {stats['p99']:>7}  {stats['n']:>4}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="?", help="directory of WAV + .txt pairs, directory of .txt files, or one .txt file")
+    parser.add_argument("--repeat", type=int, default=3, help="times the corpus is replayed in one session")
+    parser.add_argument("--ai-latency", type=float, default=0.05, help="seconds per streamed sentence from the fake Gemini")
+    parser.add_argument("--service-latency", type=float, default=0.01, help="seconds the stub news/Wikipedia servers wait per request")
+    parser.add_argument("--baseline", help="JSON result to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed slowdown as a fraction (default 0.2)")
+    parser.add_argument("--save-baseline", metavar="FILE", help="write this run's result as a baseline")
+    parser.add_argument("--verbose", action="store_true", help="show the assistant's log")
+    args = parser.parse_args()
+
+    kind, items = load_corpus(args.corpus)
+    if not items:
+        sys.exit("The corpus is empty.")
+
+    with tempfile.TemporaryDirectory(prefix="jarvis-bench-") as home, \
+            StubNewsServer(latency=args.service_latency) as news, \
+            StubWikipediaServer(latency=args.service_latency) as wiki:
+        # main reads its configuration at import time, so the stand-ins are wired in first
+        os.environ.update({
+            "HOME": home, "USERPROFILE": home,
+            "GEMINI_API_KEY": "bench", "NEWS_API_KEY": "bench", "NEWS_API_URL": news.news_url,
+            "JARVIS_WIKIPEDIA_URL": wiki.url, "JARVIS_RECOGNIZER": "stub", "JARVIS_WARMUP": "0",
+        })
+        sys.path.insert(0, HERE)
+        import main as jarvis
+        if not args.verbose:
+            jarvis.logging.getLogger().setLevel(jarvis.logging.WARNING)
+
+        result = run_replay(jarvis, kind, items, args.repeat, args.ai_latency, home)
+        result["news_requests"] = news.requests
+        result["wikipedia_requests"] = wiki.requests
+
+    print_report(result)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(result, baseline, args.max_regression)
+        if problems:
+            print(f"\nREGRESSION (more than {args.max_regression:.0%} worse than {args.baseline}):")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print(f"\nNo regression beyond {args.max_regression:.0%} against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
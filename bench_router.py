@@ -0,0 +1,86 @@
+"""
+Micro-benchmark for IntentRouter dispatch cost.
+
+Builds a large synthetic command table and compares the compiled token trie
+against the old style of running `in` substring tests one branch at a time.
+
+    python bench_router.py --intents 5000 --queries 20000
+"""
+import argparse
+import random
+import string
+from time import perf_counter
+
+from main import IntentRouter
+
+
+def random_word(rng):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 8)))
+
+
+def build_table(rng, intents, phrases_per_intent):
+    table = []
+    for i in range(intents):
+        phrases = [" ".join(random_word(rng) for _ in range(rng.randint(1, 3))) for _ in range(phrases_per_intent)]
+        table.append((f"intent_{i}", phrases))
+    return table
+
+
+def build_queries(rng, table, count):
+    queries = []
+    for _ in range(count):
+        if rng.random() < 0.8:
+            _, phrases = rng.choice(table)
+            words = [random_word(rng) for _ in range(rng.randint(0, 4))]
+            words.insert(rng.randint(0, len(words)), rng.choice(phrases))
+            queries.append(" ".join(words))
+        else:
+            # Free-form questions that fall through to the AI chat
+            queries.append(" ".join(random_word(rng) for _ in range(rng.randint(3, 10))))
+    return queries
+
+
+def linear_chain(table, query):
+    for intent, phrases in table:
+        if any(phrase in query for phrase in phrases):
+            return intent
+    return None
+
+
+def timed(fn, queries):
+    started = perf_counter()
+    for query in queries:
+        fn(query)
+    return (perf_counter() - started) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--intents", type=int, default=2000)
+    parser.add_argument("--phrases", type=int, default=3, help="phrases per intent")
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    table = build_table(rng, args.intents, args.phrases)
+    queries = build_queries(rng, table, args.queries)
+
+    started = perf_counter()
+    router = IntentRouter()
+    for intent, phrases in table:
+        router.register(intent, phrases)
+    compile_ms = (perf_counter() - started) * 1000
+
+    trie_us = timed(router.match, queries)
+    chain_us = timed(lambda q: linear_chain(table, q), queries[:max(1, args.queries // 10)])
+
+    print(f"{args.intents} intents x {args.phrases} phrases, {args.queries} queries")
+    print(f"  compile table:       {compile_ms:9.2f} ms")
+    print(f"  trie dispatch:       {trie_us:9.2f} us/query")
+    print(f"  substring chain:     {chain_us:9.2f} us/query")
+    print(f"  speedup:             {chain_us / trie_us:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
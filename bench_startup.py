@@ -0,0 +1,62 @@
+"""
+Startup benchmark for main.py.
+
+Launches the assistant several times with JARVIS_STARTUP_BENCH=1 and reports the
+time from process start to the first window draw and to the first listen. In that
+mode the app starts listening on its own and exits right after.
+
+    python bench_startup.py --runs 5
+    python bench_startup.py --no-warmup   # measure without background imports
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from time import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EVENTS = ("first_draw", "first_listen")
+
+
+def run_once(timeout, warmup):
+    env = dict(os.environ, JARVIS_STARTUP_BENCH="1", JARVIS_WARMUP="1" if warmup else "0")
+    started = time()
+    result = subprocess.run([sys.executable, os.path.join(HERE, "main.py")], cwd=HERE, env=env,
+                            capture_output=True, text=True, timeout=timeout)
+    marks = {}
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) == 3 and parts[0] == "STARTUP":
+            marks[parts[1]] = (float(parts[2]) - started) * 1000
+    if not marks:
+        print(result.stderr[-2000:], file=sys.stderr)
+    return marks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--no-warmup", action="store_true", help="disable background imports after the first draw")
+    args = parser.parse_args()
+
+    samples = {event: [] for event in EVENTS}
+    for i in range(args.runs):
+        marks = run_once(args.timeout, not args.no_warmup)
+        print(f"run {i + 1}: " + ", ".join(f"{event}={marks[event]:.0f} ms" for event in EVENTS if event in marks))
+        for event in EVENTS:
+            if event in marks:
+                samples[event].append(marks[event])
+
+    print("\nprocess start ->")
+    for event in EVENTS:
+        values = samples[event]
+        if values:
+            print(f"  {event:<13} median {statistics.median(values):7.0f} ms   min {min(values):7.0f} ms   max {max(values):7.0f} ms")
+        else:
+            print(f"  {event:<13} not reached")
+
+
+if __name__ == "__main__":
+    main()
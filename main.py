@@ -1,352 +1,3560 @@
+from time import sleep, perf_counter, time
+LAUNCH_TIME = time() # Taken before any other import, for the startup measurements
 import os
 import threading
-from time import sleep
 import webbrowser
 import datetime
 import logging
-import customtkinter as ctk
 import speech_recognition as sr
-import pyttsx3
-import pyautogui
-import psutil
-import requests
-import google.generativeai as genai
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from webdriver_manager.chrome import ChromeDriverManager
 from dotenv import load_dotenv
-import wikipedia
 import random
 import math
-import pyjokes 
+import audioop
+import collections
+import itertools
+import queue
+import re
+import hashlib
+import wave
+import importlib
+import importlib.util
+import json
+import contextlib
+import logging.handlers
+import argparse
+import sys
+import sqlite3
+import shlex
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from urllib.parse import quote, quote_plus
+
+
+# --- Lazy Imports ---
+class LazyModule:
+    """
+    Stands in for a module and imports it on first attribute access.
+    Heavy dependencies that most sessions never touch (Selenium, Wikipedia, ...)
+    therefore cost nothing until a command actually needs them.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    started = perf_counter()
+                    self._module = importlib.import_module(self._name)
+                    logging.debug(f"Imported {self._name} in {(perf_counter() - started) * 1000:.0f} ms")
+        return self._module
+
+    def is_loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return f"<LazyModule {self._name} ({'loaded' if self._module else 'not loaded'})>"
+
+
+ctk = LazyModule("customtkinter") # Only the GUI front end needs it
+pyttsx3 = LazyModule("pyttsx3")
+pyaudio = LazyModule("pyaudio")
+pyautogui = LazyModule("pyautogui")
+psutil = LazyModule("psutil")
+requests = LazyModule("requests")
+genai = LazyModule("google.generativeai")
+webdriver = LazyModule("selenium.webdriver")
+chrome_service = LazyModule("selenium.webdriver.chrome.service")
+chrome_driver_manager = LazyModule("webdriver_manager.chrome")
+wikipedia = LazyModule("wikipedia")
+pyjokes = LazyModule("pyjokes")
+np = LazyModule("numpy")
+
+
+def warm_up(modules):
+    """Imports the given lazy modules on a background thread."""
+    def _load_all():
+        for module in modules:
+            try:
+                module.load()
+            except Exception as e:
+                logging.warning(f"Background import of {module!r} failed: {e}")
+    threading.Thread(target=_load_all, name="warm-up", daemon=True).start()
 
 
 # --- Load Environment Variables for Security ---
 load_dotenv()
 
+# --- Startup ---
+# Modules imported in the background once the window is up, because the first commands usually need them
+WARMUP_MODULES = [genai, requests, pyjokes]
+WARMUP_ENABLED = os.getenv("JARVIS_WARMUP", "1") != "0"
+# Set by bench_startup.py: print timing markers, start listening automatically and exit after the first listen
+STARTUP_BENCH = os.getenv("JARVIS_STARTUP_BENCH") == "1"
+
 # --- GLOBAL CONFIGURATION & SETUP ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# 🛑 ACTION REQUIRED (STEP 1): Change this index for your Dell microphone 🛑
-# Run the `check_mics.py` script I gave you to find the correct number for your Dell's microphone.
-# It is probably 1 or 2, but you must check.
-MIC_DEVICE_INDEX = 0 
+# --- Local State (caches, history, learned settings) ---
+JARVIS_HOME = os.path.join(os.path.expanduser("~"), ".jarvis")
+
+# --- Log Settings ---
+LOG_FLUSH_MS = 50 # The GUI log is refreshed in batches at this period (about 20 fps)
+LOG_MAX_BATCH = 200 # Most messages written to the widget per refresh
+LOG_MAX_LINES = 500 # Lines kept in the on-screen log; the full history goes to LOG_FILE
+LOG_FILE = os.path.join(JARVIS_HOME, "jarvis.log")
+LOG_FILE_MAX_BYTES = 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+
+def configure_log_file(path=LOG_FILE):
+    """Sends the complete log history to a rotating file next to the other local state."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_FILE_MAX_BYTES,
+                                                       backupCount=LOG_FILE_BACKUPS, encoding="utf-8")
+    except OSError as e:
+        logging.warning(f"Log file disabled: {e}")
+        return
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logging.getLogger().addHandler(handler)
+
+
+def load_state(path, default):
+    """Reads a JSON state file, returning `default` if it is missing or unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_state(path, data):
+    """Writes a JSON state file atomically. Failures are logged, never raised."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not save {path}: {e}")
+
+# --- Microphone Selection ---
+# The input device is picked by MicrophoneProbe at startup. Set JARVIS_MIC_INDEX to force a device index.
+MIC_DEVICE_INDEX = int(os.environ["JARVIS_MIC_INDEX"]) if os.getenv("JARVIS_MIC_INDEX", "").strip().isdigit() else None
+MIC_PROFILE_FILE = os.path.join(JARVIS_HOME, "microphones.json")
+MIC_PROBE_SECONDS = 0.5 # Sample taken from every device while probing (all devices are sampled at once)
+
+# --- Latency Tracing ---
+TRACE_ENABLED = os.getenv("JARVIS_TRACE", "1") != "0" # Set JARVIS_TRACE=0 to turn all instrumentation off
+TRACE_FILE = os.path.join(JARVIS_HOME, "latency.jsonl")
+TRACE_FILE_MAX_BYTES = 1024 * 1024 # The trace file is moved to latency.jsonl.1 (replacing it) past this size
+TRACE_TURN_MAX_AGE = 120 # Seconds an unfinished turn is kept (e.g. an utterance dropped before it was handled)
+TRACE_WINDOW = 500 # Samples kept per stage / intent for the rolling percentiles
+
+# --- Audio Capture Settings ---
+PAUSE_THRESHOLD = 1.0       # Seconds of silence that end a phrase
+PHRASE_TIME_LIMIT = 10      # Longest phrase we record, in seconds
+RING_BUFFER_SECONDS = 30    # How much recent microphone audio is kept in memory
+BARGE_IN_INTENTS = ("cancel", "mute", "exit") # The only commands acted on when heard while Jarvis is talking
+
+# --- Speech Recognition Settings ---
+# "google" (default, online), "sphinx" (offline, needs pocketsphinx) or "stub" (tests/benchmarks)
+RECOGNIZER_BACKEND = os.getenv("JARVIS_RECOGNIZER", "google")
+RECOGNITION_WORKERS = 2
+
+# --- Speech Gate (drops non-speech before it is sent for recognition) ---
+SPEECH_GATE_ENABLED = os.getenv("JARVIS_SPEECH_GATE", "1") != "0"
+WAKE_WORD = os.getenv("JARVIS_WAKE_WORD", "") # e.g. "jarvis": only utterances containing it are recognized
+WAKE_WORD_SENSITIVITY = 0.8 # PocketSphinx keyword threshold (0-1, higher accepts more)
+PREPROCESS_ENABLED = os.getenv("JARVIS_PREPROCESS", "1") != "0" # Resample/normalize audio before upload
+PREPROCESS_RATE = 16000
+
+# --- Text-to-Speech Settings ---
+TTS_RATE = 180
+TTS_VOLUME = 1.0
+TTS_VOICE_INDEX = 1 # Change to 0 to try the other default voice
+EMOTION_VOICES = { # emotion -> (rate, volume)
+    "excited": (TTS_RATE + 40, 1.0),
+    "happy": (TTS_RATE + 20, 1.0),
+    "worry": (TTS_RATE - 40, 0.65),
+    "normal": (TTS_RATE, TTS_VOLUME),
+}
+
+# --- Phrase Audio Cache ---
+PHRASE_CACHE_DIR = os.path.join(JARVIS_HOME, "phrases")
+PHRASE_CACHE_MAX_MB = 50
+# Fixed lines rendered to audio once and then played straight from disk: (text, emotion)
+FIXED_PHRASES = [
+    ("Good Morning sir! I am Jarvis. How can I assist you today?", "excited"),
+    ("Good Afternoon sir! I am Jarvis. How can I assist you today?", "excited"),
+    ("Good Evening sir! I am Jarvis. How can I assist you today?", "excited"),
+    ("Command canceled. What's next?", "normal"),
+    ("Opening YouTube", "normal"),
+    ("Opening Gmail", "normal"),
+    ("Turning up the volume.", "normal"),
+    ("Turning down the volume.", "normal"),
+    ("Muting the system.", "normal"),
+    ("Unmuting the system.", "normal"),
+    ("Fetching the top news headlines for you.", "normal"),
+    ("Searching Wikipedia...", "normal"),
+    ("Opening browser...", "normal"),
+    ("Closing the browser.", "normal"),
+    ("Goodbye, sir! Have a great day.", "normal"),
+    ("Gemini API key is not configured.", "worry"),
+    ("News API key is not configured, sir.", "worry"),
+    ("I apologize, I couldn't find any recent news.", "worry"),
+    ("I'm not sure how to handle that command. Please be more specific.", "worry"),
+    ("Error: Microphone index is incorrect. Please check JARVIS_MIC_INDEX.", "worry"),
+]
 
 # --- Gemini API Setup ---
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") 
 if not GEMINI_API_KEY:
     logging.error("GEMINI_API_KEY not found. AI chat will not work.")
-else:
-    genai.configure(api_key=GEMINI_API_KEY)
+# genai.configure() runs on the first AI request, so the SDK is not imported at startup
+
+AI_MODEL_NAME = "gemini-1.5-flash" # Using 1.5-flash for speed
+AI_SYSTEM_PROMPT = "You are a helpful, brief, and concise voice assistant named Jarvis. Acting like best friend . My name is Tanmay"
+AI_STREAM_REPLIES = True # Speak Gemini replies sentence by sentence while they are generated
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# --- Conversation Memory ---
+CONVERSATION_FILE = os.path.join(JARVIS_HOME, "conversation.json")
+CONVERSATION_TOKEN_BUDGET = 1500 # Tokens of recent exchanges sent verbatim with every prompt
+CONVERSATION_SUMMARY_TOKENS = 300 # Longest rolling summary of the older exchanges
 
 # --- News API Setup ---
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
 if not NEWS_API_KEY:
     logging.warning("NEWS_API_KEY not found. News functionality will be disabled.")
+NEWS_CACHE_TTL = 10 * 60 # Seconds a fetched set of headlines counts as fresh
+NEWS_REFRESH_INTERVAL = 15 * 60 # Seconds between background refreshes while Jarvis is running
 
 
-# --- Main Application Class ---
-class JarvisApp:
-    def __init__(self, root_widget):
-        """Initializes the GUI, TTS engine, and core components."""
-        self.root = root_widget
-        self.root.title("AI Voice Assistant")
-        self.root.geometry("900x700")
+def news_api_url():
+    """NEWS_API_URL is either the scheme-less "://newsapi.org/..." from the README, or a full URL (e.g. a local stub)."""
+    url = os.getenv("NEWS_API_URL", "://newsapi.org/v2/top-headlines")
+    return f"https{url}" if url.startswith("://") else url
 
-        self.driver = None  
-        self.jarvis_thread = None
-        self.stop_jarvis_event = threading.Event()
-        self.pulse_job = None 
-        
-        # --- NEW: Speaking/Interrupt Flags ---
+# --- Wikipedia Knowledge Cache ---
+KNOWLEDGE_DB = os.path.join(JARVIS_HOME, "knowledge.sqlite3")
+KNOWLEDGE_TTL = 7 * 24 * 3600 # Seconds before a summary is refreshed (stale copies still answer offline)
+KNOWLEDGE_MAX_ENTRIES = 2000
+KNOWLEDGE_PREFETCH = 3 # Related topics fetched in the background after each new lookup
+WIKIPEDIA_SENTENCES = 2
+WIKIPEDIA_API_URL = os.getenv("JARVIS_WIKIPEDIA_URL") # Set to use the REST API (or a local stub) instead of the wikipedia package
+
+# --- Answer Racing (knowledge questions go to several sources at once) ---
+ANSWER_STATS_FILE = os.path.join(JARVIS_HOME, "answers.json")
+ANSWER_CACHE_SIZE = 200 # Winning answers kept for repeat questions
+ANSWER_CACHE_TTL = 24 * 3600
+RACE_TIMEOUT = 15
+RACE_MIN_HEDGE = 0.1 # Bounds (seconds) on the favorite source's head start
+RACE_MAX_HEDGE = 1.5
+# "who is coming to dinner" is not about an entity. Such topics go to the AI chat, which still answers them.
+NON_ENTITY_WORDS = ("i", "me", "you", "yourself", "he", "him", "she", "her", "it", "we", "us", "they", "them",
+                    "this", "that", "there", "here", "to", "in", "on", "at", "for", "with", "up", "out", "not")
+ENTITY_TOPIC = re.compile(r"(?!(?:" + "|".join(NON_ENTITY_WORDS) + r"|[a-z]{2,}ing)\b)[a-z0-9'].*") # Slot must match this
+
+# --- HTTP Settings ---
+HTTP_CACHE_TTL = 5 * 60
+HTTP_CACHE_SIZE = 256 # Responses kept, least recently used dropped first
+HTTP_POOL_SIZE = 8
+HTTP_TIMEOUT = 10
+
+# --- Browser Settings ---
+BROWSER_HEADLESS = os.getenv("JARVIS_BROWSER_HEADLESS") == "1"
+BROWSER_IDLE_TIMEOUT = 15 * 60 # Seconds an unused browser stays open
+BROWSER_STATE_FILE = os.path.join(JARVIS_HOME, "browser.json")
+BROWSER_INTENTS = ("search_google",) # Commands that need Chrome; heard one, start it right away
+# Point this at a local page server to test search_google offline
+GOOGLE_SEARCH_URL = os.getenv("JARVIS_SEARCH_URL", "https://www.google.com/search")
+
+# --- Application Catalog ---
+APP_CATALOG_FILE = os.path.join(JARVIS_HOME, "apps.json")
+APP_MATCH_THRESHOLD = 0.45 # Least trigram similarity for "open <name>" to launch something
+
+# --- Volume Control ---
+# "auto" picks pycaw (Windows), pactl (PulseAudio/PipeWire) or amixer (ALSA), then media keys; "fake" keeps it in memory
+VOLUME_BACKEND = os.getenv("JARVIS_VOLUME", "auto")
+VOLUME_STEP = 10 # Percent per "volume up" / "volume down"
+VOLUME_CACHE_SECONDS = 30 # The mixer is queried again after this long, in case the level was changed elsewhere
+
+# --- Command Execution ---
+COMMAND_WORKERS = 4
+COMMAND_TIMEOUT = 30 # Seconds before a background command is abandoned
+BACKGROUND_INTENTS = { # Intents that wait on the network: intent -> (concurrent runs, timeout in seconds)
+    "ai_chat": (1, 60),
+    "news": (1, 20),
+    "wikipedia": (2, 20),
+    "search_google": (1, 45),
+    "knowledge": (2, 30),
+}
+
+
+# --- Latency Tracing ---
+class LatencyTracer:
+    """
+    Per-stage timing for the command pipeline.
+    Each turn gets an ID when its utterance is captured; stages record durations under
+    it, rolling windows per stage and per intent give p50/p95/p99, and every finished
+    turn is appended to a JSON lines file, which is rotated once it reaches max_bytes.
+    Turns never ended are dropped after max_age. When disabled every call returns at once.
+    """
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, enabled=TRACE_ENABLED, path=TRACE_FILE, window=TRACE_WINDOW,
+                 max_bytes=TRACE_FILE_MAX_BYTES, max_age=TRACE_TURN_MAX_AGE):
+        self.enabled = enabled
+        self.path = path
+        self.window = window
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._ids = itertools.count(1)
+        self._turns = {}    # turn id -> {"started": perf_counter, "intent": str, "stages": {name: ms}}
+        self._finished = [] # Turns waiting to be written; late stages (e.g. first audio) can still land
+        self._stages = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+        self._intents = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def begin_turn(self):
+        """Starts a new turn and returns its ID (None when tracing is off)."""
+        if not self.enabled:
+            return None
+        turn_id = next(self._ids)
+        now = perf_counter()
+        with self._lock:
+            stale = [tid for tid, turn in self._turns.items()
+                     if now - turn["started"] > self.max_age and tid not in self._finished]
+            for tid in stale:
+                del self._turns[tid]
+            self._turns[turn_id] = {"turn": turn_id, "ts": round(time(), 3), "started": now,
+                                    "intent": None, "stages": {}}
+        return turn_id
+
+    def set_current(self, turn_id):
+        """Makes turn_id the default for calls from this thread."""
+        self._local.turn = turn_id
+
+    def current_turn(self):
+        return getattr(self._local, "turn", None)
+
+    def record(self, stage, seconds, turn_id=None):
+        if not self.enabled:
+            return
+        turn_id = turn_id or self.current_turn()
+        ms = seconds * 1000
+        with self._lock:
+            self._stages[stage].append(ms)
+            turn = self._turns.get(turn_id)
+            if turn is not None:
+                turn["stages"][stage] = round(turn["stages"].get(stage, 0) + ms, 2)
+                if turn["intent"]:
+                    self._intents[(turn["intent"], stage)].append(ms)
+
+    @contextlib.contextmanager
+    def stage(self, name, turn_id=None):
+        """Times the enclosed block as one stage of the turn."""
+        if not self.enabled:
+            yield
+            return
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - started, turn_id)
+
+    def mark_first(self, stage, turn_id=None):
+        """Records the time since the turn started, once per turn (e.g. time to first audio)."""
+        if not self.enabled:
+            return
+        turn_id = turn_id or self.current_turn()
+        with self._lock:
+            turn = self._turns.get(turn_id)
+            if turn is None or stage in turn["stages"]:
+                return
+            elapsed = perf_counter() - turn["started"]
+        self.record(stage, elapsed, turn_id)
+
+    def set_intent(self, intent, turn_id=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            turn = self._turns.get(turn_id or self.current_turn())
+            if turn is not None:
+                turn["intent"] = intent
+
+    def end_turn(self, turn_id=None):
+        """Records the turn's total time and queues it for the log file."""
+        if not self.enabled:
+            return
+        turn_id = turn_id or self.current_turn()
+        self.mark_first("total", turn_id)
+        with self._lock:
+            turn = self._turns.get(turn_id)
+            if turn is None:
+                return
+            ready, self._finished = self._finished, [turn_id]
+        self._write(ready)
+
+    def close(self):
+        with self._lock:
+            ready, self._finished = self._finished, []
+        self._write(ready)
+        with self._lock:
+            self._turns.clear() # Utterances still pending at stop never end
+
+    def _write(self, turn_ids):
+        with self._lock:
+            turns = [self._turns.pop(turn_id) for turn_id in turn_ids if turn_id in self._turns]
+        if not turns:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a", encoding="utf-8") as f:
+                for turn in turns:
+                    turn.pop("started", None)
+                    f.write(json.dumps(turn, separators=(",", ":")) + "\n")
+        except OSError as e:
+            logging.warning(f"Could not write latency trace: {e}")
+
+    @classmethod
+    def _percentiles(cls, samples):
+        ordered = sorted(samples)
+        result = {f"p{p}": round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))], 1)
+                  for p in cls.PERCENTILES}
+        result["n"] = len(ordered)
+        return result
+
+    def snapshot(self):
+        """Rolling percentiles in ms: {"stages": {stage: {...}}, "intents": {"intent/stage": {...}}}."""
+        with self._lock:
+            stages = {name: list(values) for name, values in self._stages.items() if values}
+            intents = {f"{intent}/{stage}": list(values) for (intent, stage), values in self._intents.items() if values}
+        return {"stages": {name: self._percentiles(values) for name, values in stages.items()},
+                "intents": {name: self._percentiles(values) for name, values in intents.items()}}
+
+    def summary_lines(self):
+        """Human-readable percentile table for the GUI log."""
+        if not self.enabled:
+            return ["Latency tracing is off (JARVIS_TRACE=0)."]
+        snapshot = self.snapshot()
+        if not snapshot["stages"]:
+            return ["No latency samples yet."]
+        lines = ["⏱️ Latency (ms)            p50      p95      p99     n"]
+        for group in ("stages", "intents"):
+            for name, stats in sorted(snapshot[group].items()):
+                lines.append(f"   {name:<22}{stats['p50']:>7}  {stats['p95']:>7}  {stats['p99']:>7}  {stats['n']:>4}")
+        return lines
+
+
+# --- Audio Capture ---
+class AudioCapture:
+    """
+    Keeps a single microphone stream open for the whole session.
+    A background thread feeds a ring buffer, tracks the noise floor continuously
+    and hands finished utterances (sr.AudioData) to a queue.
+    While Jarvis is talking, listening continues at a raised threshold, and phrases that
+    overlap the reply are handed over as `overlapped`: the engine only acts on those if
+    they are a barge-in command ("cancel", "stop talking"), since anything else is most
+    likely Jarvis's own voice. With `barge_in` (on when a wake word is set, which already
+    filters the echo) nothing is flagged.
+    """
+    PRE_ROLL_SECONDS = 0.3     # Audio kept from before the speech onset
+    MIN_PHRASE_SECONDS = 0.3   # Shorter bursts (clicks, knocks) are ignored
+    NOISE_ADAPT_RATE = 0.05    # How quickly the noise floor follows the room
+    SPEECH_RATIO = 2.5         # Energy above noise_floor * ratio counts as speech
+    BARGE_IN_RATIO = 2.0       # Extra margin while Jarvis is talking, to ignore its own voice
+    ECHO_TAIL_SECONDS = 0.5    # Audio still treated as echo after Jarvis stops talking (playback lag, room echo)
+    MIN_ENERGY = 50
+
+    def __init__(self, device_index=MIC_DEVICE_INDEX, is_speaking=None, on_utterance=None,
+                 sample_rate=None, noise_floor=None, on_error=None, barge_in=bool(WAKE_WORD)):
+        self.device_index = device_index
+        self.barge_in = barge_in
+        self.sample_rate = sample_rate # None: the device's default rate
+        self.is_speaking = is_speaking or (lambda: False)
+        self.on_utterance = on_utterance or (lambda audio, overlapped=False: self.utterances.put(audio))
+        self.on_error = on_error # Called from the capture thread once the stream has failed and is closed
+        self.utterances = queue.Queue()
+        self.noise_floor = noise_floor # Calibrated starting value, otherwise the first chunk's energy
+        self.error = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._source = None
+
+    def start(self):
+        """Opens the microphone once and starts the background capture thread."""
+        if self.is_running():
+            return
+        self.error = None
+        self._stop_event.clear()
+        self._source = sr.Microphone(device_index=self.device_index, sample_rate=self.sample_rate).__enter__()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the capture thread; the stream is closed by the thread itself."""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def energy_threshold(self, echo=False):
+        threshold = max(self.MIN_ENERGY, (self.noise_floor or 0) * self.SPEECH_RATIO)
+        if echo or self.is_speaking():
+            threshold *= self.BARGE_IN_RATIO
+        return threshold
+
+    def get_utterance(self, timeout=None):
+        """Returns the next finished utterance, raising sr.WaitTimeoutError if none arrives in time."""
+        try:
+            return self.utterances.get(timeout=timeout)
+        except queue.Empty:
+            if self.error:
+                raise self.error
+            raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+
+    def _run(self):
+        """Reads the stream chunk by chunk and segments it into utterances."""
+        source = self._source
+        seconds_per_chunk = source.CHUNK / source.SAMPLE_RATE
+        ring = collections.deque(maxlen=int(math.ceil(RING_BUFFER_SECONDS / seconds_per_chunk)))
+        pre_roll = int(math.ceil(self.PRE_ROLL_SECONDS / seconds_per_chunk))
+        pause_chunks = int(math.ceil(PAUSE_THRESHOLD / seconds_per_chunk))
+        min_chunks = int(math.ceil(self.MIN_PHRASE_SECONDS / seconds_per_chunk))
+        max_chunks = int(math.ceil(PHRASE_TIME_LIMIT / seconds_per_chunk))
+        echo_tail = int(math.ceil(self.ECHO_TAIL_SECONDS / seconds_per_chunk))
+
+        total = 0       # Chunks read since the stream was opened
+        start = None    # Absolute chunk index where the current phrase began
+        silent = 0      # Consecutive quiet chunks inside the current phrase
+        energies = []   # Chunk energies of the current phrase
+        echo_end = 0    # Absolute chunk index where audio stops possibly being Jarvis's own voice
+        overlapped = False # The current phrase was (partly) heard while Jarvis was talking
+        try:
+            while not self._stop_event.is_set():
+                chunk = source.stream.read(source.CHUNK)
+                ring.append(chunk)
+                total += 1
+                energy = audioop.rms(chunk, source.SAMPLE_WIDTH)
+                if self.noise_floor is None:
+                    self.noise_floor = energy
+                if self.is_speaking():
+                    echo_end = total + echo_tail
+                echo = total <= echo_end
+                threshold = self.energy_threshold(echo)
+
+                if start is None:
+                    if energy > threshold:
+                        start = max(total - 1 - pre_roll, total - len(ring))
+                        silent = 0
+                        energies = [energy]
+                        overlapped = echo and not self.barge_in
+                    elif not echo: # Jarvis's voice is not room noise
+                        self.noise_floor += (energy - self.noise_floor) * self.NOISE_ADAPT_RATE
+                    continue
+
+                energies.append(energy)
+                overlapped = overlapped or (echo and not self.barge_in)
+                silent = silent + 1 if energy <= threshold else 0
+                length = total - start
+                if silent >= pause_chunks or length >= max_chunks:
+                    if length - silent - pre_roll >= min_chunks:
+                        # Keep a little trailing silence, like sr.Recognizer.listen does
+                        count = length - max(0, silent - pre_roll)
+                        end = len(ring) - (total - start - count)
+                        frames = itertools.islice(ring, len(ring) - length, end)
+                        self.on_utterance(sr.AudioData(b"".join(frames), source.SAMPLE_RATE, source.SAMPLE_WIDTH),
+                                          overlapped=overlapped)
+                    if length >= max_chunks:
+                        # Never quiet for a whole phrase: the room got louder (a fan, a TV), so follow it up
+                        self.noise_floor = max(self.noise_floor, sorted(energies)[len(energies) // 5])
+                    start = None
+        except Exception as e:
+            logging.error(f"Audio capture stopped: {e}")
+            self.error = e
+        finally:
+            try:
+                source.__exit__(None, None, None)
+            except Exception:
+                pass
+            if self.error and self.on_error:
+                self.on_error(self.error)
+
+
+# --- Microphone Selection ---
+class MicrophoneProbe:
+    """
+    Ranks the input devices PyAudio lists. Each device is sampled for MIC_PROBE_SECONDS
+    (all of them at the same time) and scored by signal-to-noise ratio and by which
+    sample rates it supports. Profiles, including the measured noise floor, are cached
+    by device fingerprint, so only devices without a usable profile are probed. A device
+    that was busy, muted or silent is not cached and gets probed again next launch.
+    """
+    RATES = (16000, 44100, 48000) # In order of preference; 16 kHz is what the recognizer wants
+    PREFERRED_RATE_BONUS = 10
+    CHUNK = 1024
+
+    def __init__(self, path=MIC_PROFILE_FILE, seconds=MIC_PROBE_SECONDS):
+        self.path = path
+        self.seconds = seconds
+        self.profiles = load_state(path, {}) # fingerprint -> profile
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(info):
+        """Identifies a device across launches; indexes change when devices are plugged in or out."""
+        return f"{info['name']}|{info.get('hostApi', 0)}|{info.get('maxInputChannels', 0)}"
+
+    def rank(self):
+        """Returns the usable devices best first, as profile dicts with their current `index`."""
+        audio = pyaudio.PyAudio()
+        try:
+            devices = [info for info in map(audio.get_device_info_by_index, range(audio.get_device_count()))
+                       if info.get("maxInputChannels", 0) > 0]
+            unknown = [info for info in devices if self.profiles.get(self.fingerprint(info), {}).get("score") is None]
+            if unknown:
+                started = perf_counter()
+                self._probe(audio, unknown)
+                logging.info(f"Probed {len(unknown)} microphone(s) in {perf_counter() - started:.2f}s")
+                with self._lock:
+                    self._save()
+        finally:
+            audio.terminate()
+
+        ranking = []
+        for info in devices:
+            key = self.fingerprint(info)
+            profile = self.profiles.get(key)
+            if profile and profile.get("score") is not None:
+                ranking.append(dict(profile, index=info["index"], fingerprint=key))
+        ranking.sort(key=lambda profile: profile["score"], reverse=True)
+        return ranking
+
+    def forget(self, fingerprint):
+        """Drops a cached profile (the device failed), so it is probed again on the next launch."""
+        with self._lock:
+            if self.profiles.pop(fingerprint, None) is not None:
+                self._save()
+
+    def _save(self):
+        save_state(self.path, {key: profile for key, profile in self.profiles.items() if profile.get("score") is not None})
+
+    def _probe(self, audio, devices):
+        """
+        Streams are opened and closed one at a time (PortAudio is not thread-safe there);
+        only the blocking reads run in parallel, so probing takes about one sample length.
+        """
+        streams = []
+        for info in devices:
+            profile = {"name": info["name"], "rates": self._supported_rates(audio, info["index"]), "score": None}
+            self.profiles[self.fingerprint(info)] = profile
+            if not profile["rates"]:
+                continue
+            try:
+                stream = audio.open(format=pyaudio.paInt16, channels=1, rate=profile["rates"][0], input=True,
+                                    input_device_index=info["index"], frames_per_buffer=self.CHUNK)
+            except (OSError, ValueError) as e:
+                logging.info(f"Microphone '{info['name']}' could not be opened: {e}")
+                continue
+            streams.append((profile, stream))
+        if not streams:
+            return
+
+        with ThreadPoolExecutor(max_workers=len(streams), thread_name_prefix="mic-probe") as pool:
+            samples = list(pool.map(lambda item: self._sample(item[1], item[0]["rates"][0]), streams))
+        for (profile, stream), levels in zip(streams, samples):
+            try:
+                stream.close()
+            except OSError:
+                pass
+            profile.update(self.score(levels, profile["rates"]))
+
+    def _supported_rates(self, audio, index):
+        rates = []
+        for rate in self.RATES:
+            try:
+                if audio.is_format_supported(rate, input_device=index, input_channels=1,
+                                             input_format=pyaudio.paInt16):
+                    rates.append(rate)
+            except ValueError: # PyAudio raises instead of returning False
+                pass
+        return rates
+
+    def _sample(self, stream, rate):
+        """Per-chunk RMS levels of a short recording; whatever was read before an error."""
+        levels = []
+        try:
+            for _ in range(max(1, int(self.seconds * rate / self.CHUNK))):
+                levels.append(audioop.rms(stream.read(self.CHUNK, exception_on_overflow=False), 2))
+        except OSError as e:
+            logging.info(f"Microphone read failed while probing: {e}")
+        return levels
+
+    @classmethod
+    def score(cls, levels, rates):
+        """
+        The quiet chunks give the noise floor, the loud ones the signal. A device that
+        only delivers digital silence is muted or unplugged and gets no score.
+        """
+        if not levels or max(levels) == 0:
+            return {"score": None, "noise_floor": 0, "snr_db": 0.0}
+        levels = sorted(levels) # Plain Python: NumPy is optional
+        noise = max(levels[len(levels) // 5], 1.0)
+        signal = max(levels[len(levels) * 19 // 20], noise)
+        snr_db = 20 * math.log10(signal / noise)
+        score = snr_db + len(rates) + (cls.PREFERRED_RATE_BONUS if cls.RATES[0] in rates else 0)
+        return {"score": round(score, 1), "noise_floor": round(noise, 1), "snr_db": round(snr_db, 1)}
+
+
+# --- Speech Recognition Backends ---
+class RecognizerBackend:
+    """
+    Interface for speech-to-text engines.
+    recognize() returns the transcript, or raises sr.UnknownValueError / sr.RequestError.
+    """
+    name = "base"
+
+    def recognize(self, audio):
+        raise NotImplementedError
+
+
+class GoogleRecognizerBackend(RecognizerBackend):
+    """Google Web Speech API (the original behaviour)."""
+    name = "google"
+
+    def __init__(self, language='en-in'):
+        self.language = language
+        self._recognizer = sr.Recognizer()
+
+    def recognize(self, audio):
+        return self._recognizer.recognize_google(audio, language=self.language)
+
+
+class SphinxRecognizerBackend(RecognizerBackend):
+    """CMU Sphinx, fully offline. Requires the pocketsphinx package."""
+    name = "sphinx"
+
+    def __init__(self, language='en-US'):
+        self.language = language
+        self._recognizer = sr.Recognizer()
+
+    def recognize(self, audio):
+        return self._recognizer.recognize_sphinx(audio, language=self.language)
+
+
+class StubRecognizerBackend(RecognizerBackend):
+    """
+    Returns canned transcripts without touching the network.
+    `transcripts` is either a callable mapping audio to text, or a sequence that is
+    cycled in call order; `delay` simulates recognition latency.
+    """
+    name = "stub"
+
+    def __init__(self, transcripts=("what time is it",), delay=0.0):
+        self._lookup = transcripts if callable(transcripts) else None
+        self._transcripts = None if self._lookup else itertools.cycle(transcripts)
+        self._lock = threading.Lock()
+        self.delay = delay
+
+    def recognize(self, audio):
+        if self.delay:
+            sleep(self.delay)
+        if self._lookup:
+            return self._lookup(audio)
+        with self._lock:
+            return next(self._transcripts)
+
+
+RECOGNIZER_BACKENDS = {
+    "google": GoogleRecognizerBackend,
+    "sphinx": SphinxRecognizerBackend,
+    "stub": StubRecognizerBackend,
+}
+
+
+def make_recognizer_backend(name=RECOGNIZER_BACKEND):
+    """Builds a recognizer backend by name, falling back to Google for unknown names."""
+    backend_class = RECOGNIZER_BACKENDS.get(name)
+    if backend_class is None:
+        logging.warning(f"Unknown recognizer backend '{name}', using Google.")
+        backend_class = GoogleRecognizerBackend
+    return backend_class()
+
+
+# --- Audio Stages (run on the recognizer workers, before recognition) ---
+class AudioRejected(Exception):
+    """Raised by an audio stage to drop an utterance before it reaches the recognizer."""
+
+
+def pcm_samples(frame_data, sample_width):
+    """Signed integer samples of raw PCM, as a NumPy view of the buffer where the width allows it."""
+    if sample_width == 1:
+        return np.frombuffer(frame_data, dtype=np.uint8).astype(np.int16) - 128 # 8-bit WAV is unsigned
+    if sample_width == 3:
+        frame_data = audioop.lin2lin(frame_data, 3, 4)
+        sample_width = 4
+    return np.frombuffer(frame_data, dtype={2: np.int16, 4: np.int32}[sample_width])
+
+
+class AudioStage:
+    """
+    A step between capture and recognition. __call__ takes sr.AudioData and returns the
+    (possibly modified) AudioData, or raises AudioRejected to drop the utterance.
+    """
+    name = "stage"
+
+    def __init__(self):
+        self.passed = 0
+        self.dropped = 0
+
+    def __call__(self, audio):
+        raise NotImplementedError
+
+    def summary(self):
+        return f"{self.name}: {self.passed} passed, {self.dropped} dropped"
+
+
+class SpeechGate(AudioStage):
+    """
+    Vectorized energy VAD. The utterance is cut into frames, each frame's RMS is compared
+    with the segment's own noise floor, and segments with too little speech (chatter below
+    the floor, hum, a phrase that ran into the time limit on silence) are dropped. Leading
+    and trailing silence is trimmed from the rest.
+    """
+    name = "speech_gate"
+    FRAME_SECONDS = 0.02
+    NOISE_PERCENTILE = 10  # Quietest frames of the segment estimate its noise floor
+    SNR = 3.0              # Frame RMS above noise floor * SNR counts as speech
+    MIN_LEVEL = 0.004      # RMS (full scale = 1.0) that is always silence
+    MIN_SPEECH_SECONDS = 0.25
+    PADDING_SECONDS = 0.2  # Silence kept around the speech so word edges survive
+
+    def __init__(self):
+        super().__init__()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def __call__(self, audio):
+        width, rate = audio.sample_width, audio.sample_rate
+        samples = pcm_samples(audio.frame_data, width)
+        frame = max(1, int(rate * self.FRAME_SECONDS))
+        frames = len(samples) // frame
+        if not frames:
+            self.dropped += 1
+            raise AudioRejected("empty segment")
+
+        scale = float(1 << (8 * min(width, 4) - 1))
+        blocks = samples[:frames * frame].reshape(frames, frame).astype(np.float32) / scale
+        rms = np.sqrt(np.mean(blocks * blocks, axis=1))
+        threshold = max(float(np.percentile(rms, self.NOISE_PERCENTILE)) * self.SNR, self.MIN_LEVEL)
+        voiced = np.flatnonzero(rms > threshold)
+        if len(voiced) * self.FRAME_SECONDS < self.MIN_SPEECH_SECONDS:
+            self.dropped += 1
+            raise AudioRejected("no speech")
+
+        padding = int(self.PADDING_SECONDS / self.FRAME_SECONDS)
+        first = max(0, voiced[0] - padding) * frame * width
+        last = min(frames, voiced[-1] + 1 + padding) * frame * width
+        self.passed += 1
+        self.bytes_in += len(audio.frame_data)
+        self.bytes_out += last - first
+        if first == 0 and last >= len(audio.frame_data):
+            return audio
+        return sr.AudioData(audio.frame_data[first:last], rate, width)
+
+    def summary(self):
+        trimmed = 100 * (1 - self.bytes_out / self.bytes_in) if self.bytes_in else 0
+        return f"{super().summary()}, {trimmed:.0f}% silence trimmed"
+
+
+class AudioPreprocessor(AudioStage):
+    """
+    Shrinks an utterance before upload: resample to 16 kHz (the rate speech models use),
+    convert to 16-bit and normalize loudness, all vectorized on a NumPy view of the
+    captured buffer. The recognizer's FLAC encoder then works on a fraction of the data.
+    """
+    name = "preprocess"
+    TARGET_RMS = 0.1   # About -20 dBFS
+    PEAK_LIMIT = 0.95  # Never scale a sample past this (full scale = 1.0)
+    MAX_GAIN = 10.0    # Don't blow up very quiet segments into noise
+    LOWPASS_ZEROS = 16 # Sinc zero crossings on each side of the anti-aliasing filter's center
+
+    def __init__(self, target_rate=PREPROCESS_RATE):
+        super().__init__()
+        self.target_rate = target_rate
+        self._kernels = {} # input rate -> low-pass FIR taps
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    def __call__(self, audio):
+        started = perf_counter()
+        width, rate = audio.sample_width, audio.sample_rate
+        samples = pcm_samples(audio.frame_data, width).astype(np.float32)
+        samples /= float(1 << (8 * min(width, 4) - 1))
+
+        if rate > self.target_rate:
+            step = rate / self.target_rate
+            # Low-pass at the new Nyquist frequency against aliasing, then linear interpolation onto the 16 kHz grid
+            samples = np.convolve(samples, self.lowpass(rate), mode="same")
+            positions = np.arange(int(len(samples) / step), dtype=np.float64) * step
+            samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+            rate = self.target_rate
+
+        if len(samples):
+            rms = float(np.sqrt(np.mean(samples * samples)))
+            peak = float(np.max(np.abs(samples)))
+            if rms > 0 and peak > 0:
+                samples *= min(self.TARGET_RMS / rms, self.PEAK_LIMIT / peak, self.MAX_GAIN)
+
+        frame_data = (samples * 32767).astype("<i2").tobytes()
+        self.passed += 1
+        self.bytes_in += len(audio.frame_data)
+        self.bytes_out += len(frame_data)
+        self.seconds += perf_counter() - started
+        return sr.AudioData(frame_data, rate, 2)
+
+    def lowpass(self, rate):
+        """Hamming-windowed sinc FIR with its cutoff at target_rate / 2, built once per input rate."""
+        kernel = self._kernels.get(rate)
+        if kernel is None:
+            cutoff = self.target_rate / 2 / rate # Cycles per input sample
+            half = int(np.ceil(self.LOWPASS_ZEROS / (2 * cutoff)))
+            n = np.arange(-half, half + 1)
+            kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(len(n))
+            kernel = (kernel / kernel.sum()).astype(np.float32) # Unity gain at DC
+            self._kernels[rate] = kernel
+        return kernel
+
+    def summary(self):
+        saved = 100 * (1 - self.bytes_out / self.bytes_in) if self.bytes_in else 0
+        average = self.seconds / self.passed * 1000 if self.passed else 0
+        return (f"{self.name}: {self.passed} segments, {self.bytes_in / 1024:.0f} KB -> "
+                f"{self.bytes_out / 1024:.0f} KB ({saved:.0f}% smaller), {average:.1f} ms each")
+
+
+class WakeWordGate(AudioStage):
+    """
+    Lets an utterance through only if it contains the wake word, spotted offline with
+    PocketSphinx keyword search. Without pocketsphinx it disables itself and passes everything.
+    """
+    name = "wake_word"
+
+    def __init__(self, keyword=WAKE_WORD, sensitivity=WAKE_WORD_SENSITIVITY):
+        super().__init__()
+        self.keyword = keyword.lower()
+        self.sensitivity = sensitivity
+        self.available = True
+        self._recognizer = sr.Recognizer()
+
+    def __call__(self, audio):
+        if not self.available:
+            return audio
+        try:
+            self._recognizer.recognize_sphinx(audio, keyword_entries=[(self.keyword, self.sensitivity)])
+        except sr.UnknownValueError:
+            self.dropped += 1
+            raise AudioRejected(f"no '{self.keyword}'")
+        except sr.RequestError as e:
+            logging.warning(f"Wake word detection unavailable ({e}); passing all speech through.")
+            self.available = False
+            return audio
+        self.passed += 1
+        return audio
+
+
+def make_audio_stages():
+    """The stages configured for this run, in order: speech gate, preprocessor, then the optional wake word."""
+    stages = []
+    if SPEECH_GATE_ENABLED or PREPROCESS_ENABLED:
+        if importlib.util.find_spec("numpy") is None:
+            logging.warning("NumPy is not installed; captured audio goes to the recognizer unfiltered and unprocessed.")
+        else:
+            if SPEECH_GATE_ENABLED:
+                stages.append(SpeechGate())
+            if PREPROCESS_ENABLED:
+                stages.append(AudioPreprocessor())
+    if WAKE_WORD:
+        stages.append(WakeWordGate())
+    return stages
+
+
+# --- Recognition Stage ---
+Transcript = collections.namedtuple("Transcript", ["seq", "text", "error", "latency", "tag", "stages", "overlapped"],
+                                    defaults=(None, False))
+
+
+class RecognitionPool:
+    """
+    Runs recognition off the listening path.
+    Captured AudioData is submitted with a sequence number, a pool of workers passes it
+    through the audio `stages` and recognizes it, and get() hands transcripts back strictly
+    in submission order. An utterance a stage rejects comes back with an AudioRejected error.
+    """
+    def __init__(self, backend, workers=RECOGNITION_WORKERS, stages=()):
+        self.backend = backend
+        self.workers = workers
+        self.stages = list(stages)
+        self.completed = 0
+        self.busy_time = 0.0
+        self.recognized = 0
+        self.recognize_time = 0.0 # Backend time only, to compare runs with and without preprocessing
+        self._jobs = queue.Queue()
+        self._results = {}
+        self._cond = threading.Condition()
+        self._next_seq = 0
+        self._next_result = 0
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"recognizer-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self._jobs.put(None)
+        self._threads = []
+        for stage in self.stages:
+            logging.info(f"Audio {stage.summary()}")
+        if self.recognized:
+            logging.info(f"Recognizer ({self.backend.name}): {self.recognized} requests, "
+                         f"{self.recognize_time / self.recognized * 1000:.0f} ms average")
+
+    def submit(self, audio, tag=None, overlapped=False):
+        """Queues audio for recognition and returns its sequence number. `tag` and `overlapped` come back on the Transcript."""
+        with self._cond:
+            seq = self._next_seq
+            self._next_seq += 1
+        self._jobs.put((seq, audio, tag, overlapped))
+        return seq
+
+    def pending(self):
+        """Number of submitted utterances whose transcript has not been collected yet."""
+        with self._cond:
+            return self._next_seq - self._next_result
+
+    def get(self, timeout=None):
+        """Returns the next Transcript in order, raising sr.WaitTimeoutError if it is not ready in time."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._next_result in self._results, timeout):
+                raise sr.WaitTimeoutError("no transcript ready")
+            transcript = self._results.pop(self._next_result)
+            self._next_result += 1
+            return transcript
+
+    def throughput(self):
+        """Utterances recognized per second of worker time."""
+        return self.completed / self.busy_time if self.busy_time else 0.0
+
+    def _worker(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            seq, audio, tag, overlapped = job
+            started = perf_counter()
+            text, error, latency = None, None, 0.0
+            timings = {}
+            try:
+                for stage in self.stages:
+                    audio = stage(audio)
+                    timings[stage.name] = perf_counter() - started - sum(timings.values())
+                recognize_started = perf_counter()
+                text = self.backend.recognize(audio)
+                latency = perf_counter() - recognize_started
+            except (AudioRejected, sr.UnknownValueError, sr.RequestError) as e:
+                error = e
+            except Exception as e:
+                error = sr.RequestError(str(e))
+            with self._cond:
+                self.completed += 1
+                self.busy_time += perf_counter() - started
+                if latency:
+                    self.recognized += 1
+                    self.recognize_time += latency
+                self._results[seq] = Transcript(seq, text, error, latency, tag, timings, overlapped)
+                self._cond.notify_all()
+
+
+# --- Speech Output ---
+class PhraseCache:
+    """
+    On-disk cache of rendered speech clips.
+    Each clip is a WAV file named by a hash of (voice, rate, volume, text). Hits touch the
+    file, and the least recently used clips are evicted once the cache passes max_bytes.
+    """
+    def __init__(self, directory=PHRASE_CACHE_DIR, max_bytes=PHRASE_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = {entry.path: entry.stat().st_size
+                       for entry in os.scandir(directory) if entry.name.endswith(".wav")}
+
+    def path_for(self, text, voice, rate, volume):
+        digest = hashlib.sha1(f"{voice}|{rate}|{volume}|{text}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".wav")
+
+    def get(self, text, voice, rate, volume):
+        """Returns the clip path on a hit (and marks it recently used), otherwise None."""
+        path = self.path_for(text, voice, rate, volume)
+        with self._lock:
+            if path not in self._sizes:
+                return None
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._sizes.pop(path, None)
+            return None
+        return path
+
+    def temp_path(self):
+        return os.path.join(self.directory, f"render-{threading.get_ident()}.tmp")
+
+    def store(self, rendered_path, text, voice, rate, volume):
+        """Moves a freshly rendered file into the cache. Returns False if it is not a playable WAV."""
+        try:
+            with wave.open(rendered_path, "rb") as clip:
+                if clip.getnframes() == 0:
+                    raise wave.Error("empty clip")
+        except (wave.Error, EOFError, OSError) as e:
+            logging.warning(f"Rendered phrase is not a usable WAV file: {e}")
+            if os.path.exists(rendered_path):
+                os.remove(rendered_path)
+            return False
+
+        path = self.path_for(text, voice, rate, volume)
+        os.replace(rendered_path, path)
+        with self._lock:
+            self._sizes[path] = os.path.getsize(path)
+            self._evict()
+        return True
+
+    def _evict(self):
+        total = sum(self._sizes.values())
+        if total <= self.max_bytes:
+            return
+        by_age = sorted(self._sizes, key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in by_age:
+            if total <= self.max_bytes:
+                break
+            total -= self._sizes.pop(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+Utterance = collections.namedtuple("Utterance", ["priority", "seq", "text", "rate", "volume", "generation", "queued_at", "turn"])
+
+
+class SpeechWorker:
+    """
+    Owns the pyttsx3 engine on one long-lived thread.
+    Utterances wait in a priority queue (lower value first, FIFO within a priority)
+    and carry their own rate and volume, so no caller ever touches engine properties.
+    cancel() drops everything queued and cuts the current utterance (barge-in).
+    With a PhraseCache, fixed phrases (and any text spoken twice) are rendered to audio
+    while the worker is idle and later played from disk instead of being synthesized.
+    With output_dir, replies are written there as numbered WAV files instead of being played.
+    """
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 5
+    IDLE_RENDER_DELAY = 0.5 # Seconds without speech before a phrase is rendered in the background
+    CLIP_CHUNK_FRAMES = 1024
+    _SHUTDOWN = -1
+
+    def __init__(self, voice_index=TTS_VOICE_INDEX, phrase_cache=None, prerender=(), tracer=None, output_dir=None):
+        self.voice_index = voice_index
+        self.output_dir = output_dir
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            phrase_cache = None # Every reply becomes its own file
+        self.phrase_cache = phrase_cache
+        self.tracer = tracer or LatencyTracer(enabled=False)
+        self.engine = None
+        self.failed = False
+        self.voice = None
+        self.cached_plays = 0
         self.is_speaking = False
-        self.speak_thread = None
+        self.spoken = 0
+        self.latencies = collections.deque(maxlen=200) # Seconds from say() to playback start
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._generation = 0
+        self._lock = threading.Lock() # Orders cancel() against the start of an utterance
+        self._ready = threading.Event()
+        self._render_backlog = collections.deque(prerender) # (text, rate, volume) waiting to be rendered
+        self._seen = collections.Counter()
+        self._audio = None # pyaudio.PyAudio for clip playback, created on first use
+        self._thread = threading.Thread(target=self._run, name="tts-worker", daemon=True)
 
-        self.status_light = None 
-        self.listening_color = "#e74c3c" # Start as Red (Off)
+    def start(self, timeout=0):
+        """
+        Starts the worker. The engine is initialized on the worker thread; utterances queued
+        meanwhile are spoken once it is ready. Returns False if initialization already failed.
+        """
+        self._thread.start()
+        if timeout:
+            self._ready.wait(timeout)
+        return not self.failed
 
-        # 🛑 ACTION REQUIRED (STEP 2): Update "YourUsername" to your Dell laptop's Windows username 🛑
-        # Find your username by opening File Explorer and going to "C:\Users\"
-        # Change "YourUsername" below to match your folder name (e.g., "C:\\Users\\tanmaydell\\...")
-        self.software_paths = {
-            "visual studio code": "C:\\Users\\YourUsername\\AppData\\Local\\Programs\\Microsoft VS Code\\Code.exe",
-            "vscode": "C:\\Users\\YourUsername\\AppData\\Local\\Programs\\Microsoft VS Code\\Code.exe",
-            "notepad": "C:\\Windows\\System32\\notepad.exe",
-            "chrome": "C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe"
-        }
+    def say(self, text, rate=TTS_RATE, volume=TTS_VOLUME, priority=PRIORITY_NORMAL, turn=None):
+        """Queues an utterance without blocking. `turn` ties it to a traced command turn."""
+        self._queue.put(Utterance(priority, next(self._seq), text, rate, volume, self._generation, perf_counter(), turn))
+
+    def cancel(self):
+        """Drops queued utterances and stops the current one. Returns True if something was playing."""
+        with self._lock:
+            self._generation += 1
+            was_speaking = self.is_speaking
+            if was_speaking:
+                # pyttsx3.Engine.stop() is thread-safe for stopping speech
+                self.engine.stop()
+        return was_speaking
 
-        # --- Text-to-Speech Engine Setup ---
+    def shutdown(self):
+        self.cancel()
+        self._queue.put(Utterance(self._SHUTDOWN, next(self._seq), None, 0, 0, None, 0, None))
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def wait_idle(self, timeout=None):
+        """Blocks until every queued utterance has been spoken. Returns False on timeout."""
+        deadline = None if timeout is None else perf_counter() + timeout
+        while self._queue.unfinished_tasks and not self.failed:
+            if deadline is not None and perf_counter() > deadline:
+                return False
+            sleep(0.05)
+        return True
+
+    def stats(self):
+        """Queue depth, utterances spoken, and start latency (ms) averaged over recent utterances."""
+        latencies = list(self.latencies)
+        average = sum(latencies) / len(latencies) * 1000 if latencies else 0.0
+        return {"queued": self.queue_depth(), "spoken": self.spoken, "cached": self.cached_plays,
+                "avg_start_latency_ms": round(average, 1)}
+
+    def _run(self):
         try:
             self.engine = pyttsx3.init()
-            self.engine.setProperty('rate', 180)
-            self.engine.setProperty('volume', 1.0)
+            self.engine.setProperty('rate', TTS_RATE)
+            self.engine.setProperty('volume', TTS_VOLUME)
             voices = self.engine.getProperty('voices')
-            if len(voices) > 1:
-                # You can change voices[1].id to voices[0].id to try the other default voice
-                self.engine.setProperty('voice', voices[1].id) 
+            if len(voices) > self.voice_index:
+                self.engine.setProperty('voice', voices[self.voice_index].id) 
+            self.voice = self.engine.getProperty('voice')
         except Exception as e:
             logging.error(f"Failed to initialize TTS engine: {e}")
             self.engine = None
+            self.failed = True
+            return
+        finally:
+            self._ready.set()
+
+        while True:
+            try:
+                item = self._queue.get(timeout=self.IDLE_RENDER_DELAY if self._render_backlog and self.phrase_cache else None)
+            except queue.Empty:
+                self._render_next()
+                continue
+            if item.priority == self._SHUTDOWN:
+                return
+            try:
+                self._speak(item)
+            finally:
+                self._queue.task_done()
+
+    def _speak(self, item):
+        with self._lock:
+            if item.generation != self._generation:
+                return # Canceled while waiting in the queue
+            self.is_speaking = True
+            self.latencies.append(perf_counter() - item.queued_at)
+        self.tracer.record("tts_start", perf_counter() - item.queued_at, item.turn)
+        self.tracer.mark_first("first_audio", item.turn)
+        try:
+            clip = self.phrase_cache.get(item.text, self.voice, item.rate, item.volume) if self.phrase_cache else None
+            if clip and self._play_clip(clip, item.generation):
+                self.cached_plays += 1
+            else:
+                self._synthesize(item)
+                self._note_phrase(item)
+        except Exception as e:
+            logging.error(f"TTS worker error: {e}")
+        finally:
+            self.is_speaking = False
+            self.spoken += 1
+
+    def _synthesize(self, item):
+        with self._lock:
+            if item.generation != self._generation:
+                return
+            self.engine.setProperty('rate', item.rate)
+            self.engine.setProperty('volume', item.volume)
+            if self.output_dir:
+                self.engine.save_to_file(item.text, os.path.join(self.output_dir, f"reply_{self.spoken + 1:04d}.wav"))
+            else:
+                self.engine.say(item.text)
+        self.engine.runAndWait()
+
+    def _play_clip(self, path, generation):
+        """Streams a cached WAV clip, stopping between chunks if the utterance is canceled."""
+        try:
+            if self._audio is None:
+                self._audio = pyaudio.PyAudio()
+            with wave.open(path, "rb") as clip:
+                stream = self._audio.open(format=self._audio.get_format_from_width(clip.getsampwidth()),
+                                          channels=clip.getnchannels(), rate=clip.getframerate(), output=True)
+                try:
+                    data = clip.readframes(self.CLIP_CHUNK_FRAMES)
+                    while data and generation == self._generation:
+                        stream.write(data)
+                        data = clip.readframes(self.CLIP_CHUNK_FRAMES)
+                finally:
+                    stream.stop_stream()
+                    stream.close()
+            return True
+        except Exception as e:
+            logging.warning(f"Could not play cached phrase, synthesizing instead: {e}")
+            return False
+
+    def _note_phrase(self, item):
+        """Text that keeps coming back is worth rendering once."""
+        if not self.phrase_cache:
+            return
+        key = (item.text, item.rate, item.volume)
+        if len(self._seen) > 1000:
+            self._seen.clear()
+        self._seen[key] += 1
+        if self._seen[key] == 2:
+            self._render_backlog.append(key)
+
+    def _render_next(self):
+        """Renders one backlog phrase to the cache (runs only while nothing is queued)."""
+        text, rate, volume = self._render_backlog.popleft()
+        if self.phrase_cache.get(text, self.voice, rate, volume):
+            return
+        rendered_path = self.phrase_cache.temp_path()
+        try:
+            self.engine.setProperty('rate', rate)
+            self.engine.setProperty('volume', volume)
+            self.engine.save_to_file(text, rendered_path)
+            self.engine.runAndWait()
+            if not self.phrase_cache.store(rendered_path, text, self.voice, rate, volume):
+                # This TTS driver does not produce WAV output, so keep synthesizing live
+                self.phrase_cache = None
+        except Exception as e:
+            logging.warning(f"Failed to render phrase '{text}': {e}")
+
+
+# --- HTTP Client ---
+CachedResponse = collections.namedtuple("CachedResponse", ["data", "etag", "fetched_at"])
+
+
+class HttpClient:
+    """
+    One pooled requests.Session shared by every web feature, plus a small LRU JSON cache.
+    get_json() answers from a fresh cached copy without touching the network,
+    revalidates stale copies with If-None-Match, and falls back to the last good
+    copy when the service cannot be reached.
+    """
+    def __init__(self, ttl=HTTP_CACHE_TTL, pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, cache_size=HTTP_CACHE_SIZE):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.hits = 0
+        self.revalidated = 0
+        self.fetched = 0
+        self._session = None
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                self._session.mount("https://", adapter)
+                self._session.mount("http://", adapter)
+            return self._session
+
+    @staticmethod
+    def _key(url, params):
+        return url, tuple(sorted((params or {}).items()))
+
+    def cached(self, url, params=None):
+        return self._lookup(self._key(url, params))
+
+    def _lookup(self, key):
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+            return cached
+
+    def _store(self, key, response):
+        with self._lock:
+            self._cache[key] = response
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def is_fresh(self, url, params=None, ttl=None):
+        cached = self.cached(url, params)
+        return cached is not None and time() - cached.fetched_at < (self.ttl if ttl is None else ttl)
+
+    def get_json(self, url, params=None, ttl=None, force=False):
+        """Returns the decoded JSON body. Raises requests exceptions only if there is no copy to fall back to."""
+        key = self._key(url, params)
+        cached = self._lookup(key)
+        if cached and not force and self.is_fresh(url, params, ttl):
+            self.hits += 1
+            return cached.data
+
+        headers = {"If-None-Match": cached.etag} if cached and cached.etag else {}
+        try:
+            response = self.session().get(url, params=params, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and cached:
+                self.revalidated += 1
+                self._store(key, cached._replace(fetched_at=time()))
+                return cached.data
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if cached:
+                logging.warning(f"{url} unreachable ({e}); using the copy from {datetime.datetime.fromtimestamp(cached.fetched_at):%H:%M}.")
+                return cached.data
+            raise
+
+        self.fetched += 1
+        self._store(key, CachedResponse(data, response.headers.get("ETag"), time()))
+        return data
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+# --- News ---
+class NewsService:
+    """
+    Keeps the top headlines in memory. A background thread refreshes them on a
+    schedule, so "read the news" is answered from memory.
+    """
+    def __init__(self, http, api_key=NEWS_API_KEY, refresh_interval=NEWS_REFRESH_INTERVAL, ttl=NEWS_CACHE_TTL):
+        self.http = http
+        self.api_key = api_key
+        self.refresh_interval = refresh_interval
+        self.ttl = ttl
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _request(self):
+        return news_api_url(), {"country": "us", "apiKey": self.api_key}
+
+    def has_fresh(self):
+        return self.http.is_fresh(*self._request(), ttl=self.ttl)
+
+    def fetch(self, force=False):
+        """Returns the News API response, from memory when it is fresh."""
+        url, params = self._request()
+        return self.http.get_json(url, params, ttl=self.ttl, force=force)
+
+    def start(self):
+        """Starts the background refresher (fetches immediately, then every refresh_interval)."""
+        if not self.api_key or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="news-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.fetch(force=True)
+            except Exception as e:
+                logging.warning(f"Background news refresh failed: {e}")
+            if self._stop_event.wait(self.refresh_interval):
+                return
+
+
+# --- Wikipedia Knowledge Cache ---
+KnowledgeEntry = collections.namedtuple("KnowledgeEntry", ["title", "summary", "fetched_at"])
+
+
+def fetch_wikipedia_summary(topic, sentences=WIKIPEDIA_SENTENCES):
+    """Looks a topic up on Wikipedia (with auto-suggest). Returns the resolved title and the first sentences."""
+    page = wikipedia.page(topic, auto_suggest=True)
+    summary = " ".join(SENTENCE_END.split(page.summary.strip())[:sentences])
+    return page.title, summary
+
+
+def related_wikipedia_topics(title, limit=KNOWLEDGE_PREFETCH):
+    """Titles Wikipedia's search ranks next to `title`, used for prefetching."""
+    return [result for result in wikipedia.search(title, results=limit + 1) if result != title][:limit]
+
+
+class TopicNotFound(LookupError):
+    """No Wikipedia article matches the topic (the REST client's counterpart of wikipedia's PageError)."""
+
+
+class WikipediaRestClient:
+    """
+    Wikipedia through its REST API on the shared HttpClient: one search call to resolve the
+    title and one summary call, instead of the wikipedia package's several requests.
+    Used when JARVIS_WIKIPEDIA_URL is set (https://en.wikipedia.org, or a local stub).
+    """
+    def __init__(self, http, base_url=WIKIPEDIA_API_URL, sentences=WIKIPEDIA_SENTENCES):
+        self.http = http
+        self.base_url = base_url.rstrip("/")
+        self.sentences = sentences
+
+    def search(self, query, limit=1):
+        data = self.http.get_json(f"{self.base_url}/w/rest.php/v1/search/title", params={"q": query, "limit": limit})
+        return [page["title"] for page in data.get("pages", [])]
+
+    def summary(self, topic):
+        """KnowledgeCache fetcher: returns the resolved title and the first sentences of its summary."""
+        titles = self.search(topic)
+        if not titles:
+            raise TopicNotFound(topic)
+        try:
+            data = self.http.get_json(f"{self.base_url}/api/rest_v1/page/summary/{quote(titles[0], safe='')}")
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                raise TopicNotFound(topic)
+            raise
+        return data["title"], " ".join(SENTENCE_END.split(data["extract"].strip())[:self.sentences])
+
+    def related(self, title, limit=KNOWLEDGE_PREFETCH):
+        """KnowledgeCache related-topics source."""
+        return [result for result in self.search(title, limit + 1) if result != title][:limit]
+
+
+class KnowledgeCache:
+    """
+    SQLite-backed store of Wikipedia summaries.
+    Topics are normalized into keys, and an alias table points every phrasing that
+    auto-suggest resolved to the same article at one entry. Entries older than `ttl`
+    are refetched, but still answer when Wikipedia is unreachable, and the least
+    recently used entries are pruned beyond `max_entries`.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS summaries (
+            key TEXT PRIMARY KEY, title TEXT, summary TEXT, fetched_at REAL, last_used REAL);
+        CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, key TEXT);
+    """
+    ARTICLES = ("the", "a", "an")
+
+    def __init__(self, path=KNOWLEDGE_DB, ttl=KNOWLEDGE_TTL, max_entries=KNOWLEDGE_MAX_ENTRIES,
+                 fetcher=fetch_wikipedia_summary, related=related_wikipedia_topics, prefetch=KNOWLEDGE_PREFETCH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.fetcher = fetcher
+        self.related = related
+        self.prefetch_count = prefetch
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(self.SCHEMA)
+        self._prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="wiki-prefetch")
+        self._prefetching = set()
+
+    @classmethod
+    def normalize(cls, topic):
+        words = re.findall(r"[a-z0-9]+", topic.lower())
+        while len(words) > 1 and words[0] in cls.ARTICLES:
+            words = words[1:]
+        return " ".join(words)
+
+    def lookup(self, topic, allow_stale=False):
+        """Returns the cached KnowledgeEntry for a topic, or None. Never touches the network."""
+        alias = self.normalize(topic)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT s.key, s.title, s.summary, s.fetched_at FROM aliases a JOIN summaries s ON s.key = a.key "
+                "WHERE a.alias = ?", (alias,)).fetchone()
+            if row is None or (not allow_stale and time() - row[3] > self.ttl):
+                return None
+            self._conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time(), row[0]))
+            self._conn.commit()
+        return KnowledgeEntry(*row[1:])
+
+    def get(self, topic, prefetch=True):
+        """Returns a KnowledgeEntry, fetching it on a miss. Offline, an expired entry is better than none."""
+        entry = self.lookup(topic)
+        if entry:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        try:
+            title, summary = self.fetcher(topic)
+        except Exception:
+            stale = self.lookup(topic, allow_stale=True)
+            if stale:
+                logging.warning(f"Wikipedia unreachable, answering '{topic}' from the cache.")
+                return stale
+            raise
+        entry = self.store(topic, title, summary)
+        if prefetch and self.prefetch_count:
+            self._prefetcher.submit(self._prefetch_related, title)
+        return entry
+
+    def store(self, topic, title, summary):
+        key = self.normalize(title)
+        now = time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)", (key, title, summary, now, now))
+            self._conn.executemany("INSERT OR REPLACE INTO aliases VALUES (?, ?)",
+                                   [(key, key), (self.normalize(topic), key)])
+            self._prune()
+            self._conn.commit()
+        return KnowledgeEntry(title, summary, now)
+
+    def _prune(self):
+        self._conn.execute(
+            "DELETE FROM summaries WHERE key IN (SELECT key FROM summaries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+        self._conn.execute("DELETE FROM aliases WHERE key NOT IN (SELECT key FROM summaries)")
+
+    def _prefetch_related(self, title):
+        try:
+            for topic in self.related(title):
+                alias = self.normalize(topic)
+                if alias in self._prefetching or self.lookup(topic):
+                    continue
+                self._prefetching.add(alias)
+                try:
+                    self.get(topic, prefetch=False)
+                finally:
+                    self._prefetching.discard(alias)
+        except Exception as e:
+            logging.debug(f"Prefetch for '{title}' stopped: {e}")
+
+    def close(self):
+        self._prefetcher.shutdown(wait=False)
+        with self._lock:
+            self._conn.close()
+
+
+# --- Conversation Memory ---
+def estimate_tokens(text):
+    """Rough token count (about four characters per token); good enough for budgeting prompts."""
+    return max(1, (len(text) + 3) // 4)
+
+
+class ConversationMemory:
+    """
+    Chat history for Gemini with a bounded prompt size.
+    Recent exchanges are kept verbatim while they fit in `budget` tokens; older ones are
+    folded into a rolling summary of at most `summary_tokens` tokens. Each exchange stores
+    its token estimate, so budgeting never re-measures old text. An optional summarizer
+    (e.g. Gemini) rewrites the summary in the background; until it answers, and whenever
+    it fails, the summary is built extractively. Everything is saved to `path` as JSON.
+    """
+    def __init__(self, path=CONVERSATION_FILE, budget=CONVERSATION_TOKEN_BUDGET,
+                 summary_tokens=CONVERSATION_SUMMARY_TOKENS, summarizer=None):
+        self.path = path
+        self.budget = budget
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+        self.folded = 0
+        self._lock = threading.Lock()
+        self._summarizing = False
+        state = load_state(path, {}) if path else {}
+        self._exchanges = collections.deque(tuple(exchange) for exchange in state.get("exchanges", ()))
+        self._tokens = sum(tokens for _, _, tokens in self._exchanges)
+        self._set_summary(state.get("summary", ""))
+
+    def _set_summary(self, summary):
+        self.summary = summary
+        self._summary_size = estimate_tokens(summary) if summary else 0
+
+    def prompt_tokens(self):
+        """Tokens the history adds to every prompt (summary + verbatim exchanges)."""
+        return self._summary_size + self._tokens
+
+    def __len__(self):
+        return len(self._exchanges)
+
+    def contents(self, prompt):
+        """Gemini `contents` for the prompt: the summary, the recent exchanges, then the new prompt."""
+        with self._lock:
+            contents = []
+            if self.summary:
+                contents.append({"role": "user", "parts": [f"Summary of our conversation so far: {self.summary}"]})
+                contents.append({"role": "model", "parts": ["Understood."]})
+            for user_text, reply, _ in self._exchanges:
+                contents.append({"role": "user", "parts": [user_text]})
+                contents.append({"role": "model", "parts": [reply]})
+        contents.append({"role": "user", "parts": [prompt]})
+        return contents
+
+    def add_exchange(self, prompt, reply):
+        """Records a finished prompt/reply pair, folding the oldest ones if the budget is exceeded."""
+        exchange = (prompt, reply, estimate_tokens(prompt) + estimate_tokens(reply))
+        with self._lock:
+            self._exchanges.append(exchange)
+            self._tokens += exchange[2]
+            folded = []
+            while self._tokens > self.budget and self._exchanges:
+                oldest = self._exchanges.popleft()
+                self._tokens -= oldest[2]
+                folded.append(oldest)
+            if folded:
+                self.folded += len(folded)
+                self._set_summary(self._fold(self.summary, folded))
+            self._save()
+        if folded and self.summarizer:
+            self._refine_summary()
+
+    def clear(self):
+        with self._lock:
+            self._exchanges.clear()
+            self._tokens = 0
+            self._set_summary("")
+            self._save()
+
+    def _fold(self, summary, exchanges):
+        """Extractive summary: the first sentence of each side, oldest lines dropped to fit."""
+        lines = summary.splitlines() if summary else []
+        for user_text, reply, _ in exchanges:
+            lines.append(f"User: {self._first_sentence(user_text)} Jarvis: {self._first_sentence(reply)}")
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        return "\n".join(lines)[-self.summary_tokens * 4:]
+
+    @staticmethod
+    def _first_sentence(text):
+        return SENTENCE_END.split(text.strip(), 1)[0][:200]
+
+    def _refine_summary(self):
+        """Asks the summarizer for a tighter summary on a background thread (one at a time)."""
+        with self._lock:
+            if self._summarizing:
+                return
+            self._summarizing = True
+            summary = self.summary
+        threading.Thread(target=self._run_summarizer, args=(summary,), name="conversation-summary", daemon=True).start()
+
+    def _run_summarizer(self, summary):
+        try:
+            refined = (self.summarizer(summary, self.summary_tokens) or "").strip()
+        except Exception as e:
+            logging.warning(f"Conversation summary failed, keeping the extractive one: {e}")
+            refined = ""
+        with self._lock:
+            self._summarizing = False
+            # Only replace it if nothing was folded in meanwhile and the result actually fits
+            if not refined or self.summary != summary or estimate_tokens(refined) > self.summary_tokens:
+                return
+            self._set_summary(refined)
+            self._save()
+
+    def _save(self):
+        """Writes the history (called with the lock held, so saves never overtake each other)."""
+        if self.path:
+            save_state(self.path, {"summary": self.summary, "exchanges": [list(exchange) for exchange in self._exchanges]})
+
+
+# --- Answer Racing ---
+RaceResult = collections.namedtuple("RaceResult", ["source", "origin", "text", "latency"])
+
+
+class AnswerRacer:
+    """
+    Answers informational questions from whichever source is fastest.
+    Local answers (the racer's own response cache, then `local`) are used at once.
+    Otherwise the network `sources` run concurrently and the first answer that passes
+    the quality check wins; the slower ones are abandoned. Wins and latencies are saved
+    per source, and once a source has a track record it gets a head start of about its
+    usual latency (the hedge delay) before the others are asked, which saves cloud calls
+    while still bounding the tail.
+    """
+    MIN_WORDS = 6
+    REJECT_PHRASES = ("may refer to", "i don't know", "i'm not sure", "i cannot", "i can't")
+    MIN_RACES_FOR_HEDGE = 3
+    LATENCY_SMOOTHING = 0.3 # Weight of the newest sample in each source's latency average
+
+    def __init__(self, sources, local=None, path=ANSWER_STATS_FILE, timeout=RACE_TIMEOUT,
+                 hedge_bounds=(RACE_MIN_HEDGE, RACE_MAX_HEDGE), cache_size=ANSWER_CACHE_SIZE, cache_ttl=ANSWER_CACHE_TTL):
+        """sources: {name: fn(topic, question) -> text or None}; local: fn(topic) -> (origin, text) or None."""
+        self.sources = dict(sources)
+        self.local = local
+        self.path = path
+        self.timeout = timeout
+        self.hedge_bounds = hedge_bounds
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        state = load_state(path, {}) if path else {}
+        self.stats = state.get("sources", {}) # name -> {"races", "wins", "latency_ms"}
+        self._answers = collections.OrderedDict(state.get("answers", {})) # topic key -> [origin, text, saved_at]
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=2 * len(self.sources) or 1, thread_name_prefix="answer")
+
+    def acceptable(self, text):
+        """Quality check: long enough, and not a refusal or a disambiguation page."""
+        if not text or len(text.split()) < self.MIN_WORDS:
+            return False
+        lowered = text.lower()
+        return not any(phrase in lowered for phrase in self.REJECT_PHRASES)
+
+    STOP_WORDS = frozenset(("the", "a", "an", "of", "in", "on", "and", "to", "for", "about"))
+
+    @classmethod
+    def relevant(cls, topic, title):
+        """True if at least half of the topic's words are in the article title, so auto-suggest drift is rejected."""
+        def words(text):
+            return {word[:-2] if word.endswith("'s") else word
+                    for word in re.findall(r"[a-z0-9']+", text.lower())} - cls.STOP_WORDS
+        wanted = words(topic)
+        return bool(wanted) and 2 * len(wanted & words(title)) >= len(wanted)
+
+    def plan(self):
+        """(favorite, hedge delay in seconds): the source to start first and how long it runs alone."""
+        with self._lock:
+            tracked = {name: stats for name, stats in self.stats.items()
+                       if name in self.sources and stats["races"] >= self.MIN_RACES_FOR_HEDGE}
+        if not tracked:
+            return None, 0.0
+        favorite = max(tracked, key=lambda name: (tracked[name]["wins"] / tracked[name]["races"], -tracked[name]["latency_ms"]))
+        low, high = self.hedge_bounds
+        return favorite, min(high, max(low, tracked[favorite]["latency_ms"] / 1000))
+
+    def race(self, topic, question=None, checkpoint=None):
+        """Returns the winning RaceResult, or None if no source gave an acceptable answer in time."""
+        started = perf_counter()
+        key = KnowledgeCache.normalize(topic)
+        local = self._cached(key) or (self.local(topic) if self.local else None)
+        if local and self.acceptable(local[1]):
+            return self._finish(key, RaceResult("cache", local[0], local[1], perf_counter() - started), {})
+
+        favorite, hedge = self.plan()
+        waiting = [name for name in self.sources if name != favorite]
+        futures = {}
+        launched = []
+
+        def launch(names):
+            for name in names:
+                futures[self._pool.submit(self._ask, name, topic, question or topic)] = name
+                launched.append(name)
+
+        launch([favorite] if favorite else waiting)
+        if not favorite:
+            waiting = []
+        latencies = {}
+        deadline = started + self.timeout
+        while futures and perf_counter() < deadline:
+            if checkpoint:
+                checkpoint()
+            done, _ = wait_futures(futures, timeout=0.05, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures.pop(future)
+                text, latency = future.result()
+                if self.acceptable(text):
+                    latencies[name] = latency
+                    for loser in futures:
+                        loser.cancel() # Not started yet: never runs. Already running: its answer is ignored
+                    return self._finish(key, RaceResult(name, name, text.strip(), perf_counter() - started),
+                                        latencies, launched)
+            # Hedge: ask the others once the favorite has had its usual time, or as soon as it failed
+            if waiting and (perf_counter() - started >= hedge or not futures):
+                launch(waiting)
+                waiting = []
+
+        for future in futures:
+            future.cancel()
+        self._finish(key, None, {}, launched)
+        stale = self._cached(key, allow_stale=True)
+        if stale:
+            return RaceResult("cache", stale[0], stale[1], perf_counter() - started)
+        return None
+
+    def _ask(self, name, topic, question):
+        started = perf_counter()
+        try:
+            text = self.sources[name](topic, question)
+        except Exception as e:
+            logging.info(f"Answer source '{name}' failed: {e}")
+            text = None
+        return text, perf_counter() - started
+
+    def _cached(self, key, allow_stale=False):
+        with self._lock:
+            saved = self._answers.get(key)
+            if saved and (allow_stale or time() - saved[2] < self.cache_ttl):
+                self._answers.move_to_end(key)
+                return saved[0], saved[1]
+        return None
+
+    def _finish(self, key, result, latencies, launched=()):
+        """Records the race (wins, latencies, the answer itself) and saves it. result is None if nobody won."""
+        with self._lock:
+            for name in set(launched) | ({result.source} if result else set()):
+                stats = self.stats.setdefault(name, {"races": 0, "wins": 0, "latency_ms": 0.0})
+                stats["races"] += 1
+                if result and name == result.source:
+                    stats["wins"] += 1
+                if name in latencies:
+                    sample = latencies[name] * 1000
+                    stats["latency_ms"] = round(sample if stats["races"] == 1 else
+                                                stats["latency_ms"] + self.LATENCY_SMOOTHING * (sample - stats["latency_ms"]), 1)
+            if result and result.source != "cache":
+                self._answers[key] = [result.origin, result.text, time()]
+                self._answers.move_to_end(key)
+                while len(self._answers) > self.cache_size:
+                    self._answers.popitem(last=False)
+            state = {"sources": self.stats, "answers": self._answers}
+            if self.path:
+                save_state(self.path, state)
+        return result
+
+    def summary_lines(self):
+        with self._lock:
+            return [f"   {name:<12} won {stats['wins']}/{stats['races']}, ~{stats['latency_ms']:.0f} ms"
+                    for name, stats in sorted(self.stats.items())]
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Browser Session ---
+class BrowserSession:
+    """
+    Owns the Selenium Chrome session.
+    The chromedriver path is resolved once and remembered on disk, the browser can be
+    started in the background before it is needed, a watchdog closes it after
+    idle_timeout, and a dead session is replaced in the background.
+    """
+    WATCHDOG_INTERVAL = 10
+
+    def __init__(self, headless=BROWSER_HEADLESS, idle_timeout=BROWSER_IDLE_TIMEOUT, state_file=BROWSER_STATE_FILE):
+        self.headless = headless
+        self.idle_timeout = idle_timeout
+        self.state_file = state_file
+        self.last_error = None
+        self._state = load_state(state_file, {})
+        self._driver = None
+        self._launcher = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+    def driver_path(self):
+        """Returns the chromedriver path, running ChromeDriverManager only when the cached one is gone."""
+        path = self._state.get("driver_path")
+        if path and os.path.exists(path):
+            return path
+        path = chrome_driver_manager.ChromeDriverManager().install()
+        self._state["driver_path"] = path
+        save_state(self.state_file, self._state)
+        return path
+
+    def recently_used(self):
+        """True if a browser was needed in an earlier session, which makes a prewarm worthwhile."""
+        return bool(self._state.get("used"))
+
+    def should_prewarm_at_startup(self):
+        """Only a headless browser is started before any web command: a visible one would open a window nobody asked for."""
+        return self.headless and self.recently_used()
+
+    def is_open(self):
+        return self._driver is not None
+
+    def is_starting(self):
+        return self._launcher is not None and self._launcher.is_alive()
+
+    def prewarm(self):
+        """Starts the browser in the background unless it is already running or starting."""
+        with self._lock:
+            if self._driver is not None or self.is_starting():
+                return self._launcher
+            self._closed.clear()
+            self._launcher = threading.Thread(target=self._launch, name="browser-launch", daemon=True)
+            self._launcher.start()
+            return self._launcher
+
+    def get(self, timeout=60):
+        """Returns a live driver, starting or replacing the browser if needed. None if that failed."""
+        if self._driver is not None and not self.is_alive():
+            self._discard()
+        launcher = self.prewarm()
+        if launcher:
+            launcher.join(timeout)
+        if self._driver is not None:
+            self._last_used = time()
+            if not self._state.get("used"):
+                self._state["used"] = True
+                save_state(self.state_file, self._state)
+        return self._driver
+
+    def is_alive(self):
+        try:
+            self._driver.current_window_handle
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        """Quits the browser. The resolved driver path stays cached for the next launch."""
+        self._closed.set()
+        self._discard()
+
+    def _discard(self):
+        with self._lock:
+            driver, self._driver = self._driver, None
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception as e:
+                logging.warning(f"Browser did not quit cleanly: {e}")
+
+    def _launch(self):
+        try:
+            options = webdriver.ChromeOptions()
+            if self.headless:
+                options.add_argument("--headless=new")
+            else:
+                options.add_argument("--start-maximized")
+            options.add_argument("--log-level=3") 
+            options.add_experimental_option("excludeSwitches", ["enable-logging"])
+            driver = webdriver.Chrome(service=chrome_service.Service(self.driver_path()), options=options)
+        except Exception as e:
+            logging.error(f"Failed to start Chrome: {e}")
+            self.last_error = e
+            return
+        self.last_error = None
+        self._last_used = time()
+        with self._lock:
+            self._driver = driver
+        threading.Thread(target=self._watchdog, args=(driver,), name="browser-watchdog", daemon=True).start()
+
+    def _watchdog(self, driver):
+        """Closes the browser when idle, and restarts it in the background if it died."""
+        while not self._closed.wait(self.WATCHDOG_INTERVAL):
+            if self._driver is not driver:
+                return
+            if time() - self._last_used > self.idle_timeout:
+                logging.info("Closing idle browser.")
+                self._discard()
+                return
+            if not self.is_alive():
+                logging.warning("Browser session died, restarting it in the background.")
+                self._discard()
+                self.prewarm()
+                return
+
+
+# --- Application Catalog ---
+AppEntry = collections.namedtuple("AppEntry", ["name", "kind", "target"]) # kind: "exec" (argv list) or "file" (path to open)
+
+
+def parse_desktop_file(path):
+    """Returns an AppEntry for a freedesktop .desktop launcher, or None if it is hidden or not an application."""
+    fields = {}
+    in_entry = False
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("["):
+                    in_entry = line == "[Desktop Entry]"
+                elif in_entry and "=" in line:
+                    key, value = line.split("=", 1)
+                    fields.setdefault(key.strip(), value.strip())
+    except OSError:
+        return None
+    if fields.get("Type", "Application") != "Application" or "Name" not in fields or "Exec" not in fields:
+        return None
+    if fields.get("NoDisplay") == "true" or fields.get("Hidden") == "true":
+        return None
+    try:
+        argv = [arg.replace("%%", "%") for arg in shlex.split(fields["Exec"]) if not re.fullmatch(r"%[a-zA-Z]", arg)]
+    except ValueError:
+        return None
+    return AppEntry(fields["Name"], "exec", argv) if argv else None
+
+
+class AppCatalog:
+    """
+    Index of launchable applications: executables on PATH, .desktop launchers and
+    Start Menu shortcuts, plus the configured software_paths (which win ties).
+    Every scanned directory is saved with its mtime, so a refresh only rescans
+    directories that changed. Names are matched through a trigram index, so
+    "open visual studio" finds "Visual Studio Code" without scanning every entry.
+    Bare PATH executables are only launched on an exact name match, and never if
+    they are system commands, so a misheard word cannot run "reboot".
+    """
+    PRIORITY_KINDS = ("configured", "launcher", "path") # Earlier sources win equal scores
+    FILLER_WORDS = ("the", "app", "application", "program")
+    PATH_DENYLIST = frozenset((
+        "reboot", "shutdown", "poweroff", "halt", "init", "telinit", "systemctl", "loginctl", "logout",
+        "kill", "killall", "pkill", "xkill", "taskkill", "rm", "rmdir", "del", "rd", "shred", "dd",
+        "mkfs", "wipefs", "fdisk", "sfdisk", "parted", "format", "diskpart", "sudo", "su", "doas",
+        "pkexec", "runas", "bcdedit", "reg", "sh", "bash", "zsh", "cmd", "powershell", "pwsh",
+    ))
+
+    def __init__(self, path=APP_CATALOG_FILE, configured=None, threshold=APP_MATCH_THRESHOLD):
+        self.path = path
+        self.configured = dict(configured or {})
+        self.threshold = threshold
+        self.ready = threading.Event()
+        self._dirs = {}     # directory -> {"mtime": float, "source": str, "apps": [[name, kind, target]], "subdirs": [...]}
+        self._entries = []  # (AppEntry, source)
+        self._names = []    # normalized name per entry
+        self._index = {}    # trigram -> set of entry positions
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # --- Sources ---
+    @staticmethod
+    def source_dirs():
+        """(directory, source, recursive) for this platform."""
+        dirs = [(d, "path", False) for d in os.get_exec_path() if os.path.isabs(d)]
+        if os.name == "nt":
+            for root in (os.getenv("APPDATA"), os.getenv("PROGRAMDATA")):
+                if root:
+                    dirs.append((os.path.join(root, "Microsoft", "Windows", "Start Menu", "Programs"), "launcher", True))
+        else:
+            data_dirs = [os.getenv("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")]
+            data_dirs += (os.getenv("XDG_DATA_DIRS") or "/usr/local/share:/usr/share").split(os.pathsep)
+            data_dirs += ["/var/lib/flatpak/exports/share", "/var/lib/snapd/desktop"]
+            dirs += [(os.path.join(d, "applications"), "launcher", True) for d in data_dirs if d]
+        return dirs
+
+    @staticmethod
+    def _scan_dir(directory, source):
+        """Lists the apps directly in one directory, and its subdirectories."""
+        apps, subdirs = [], []
+        executable_exts = {ext.lower() for ext in os.getenv("PATHEXT", ".EXE;.BAT;.CMD").split(";")} if os.name == "nt" else None
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.path)
+                        continue
+                    stem, ext = os.path.splitext(entry.name)
+                    if source == "path":
+                        if executable_exts is not None:
+                            if ext.lower() in executable_exts:
+                                apps.append([stem, "exec", [entry.path]])
+                        elif entry.is_file() and os.access(entry.path, os.X_OK):
+                            apps.append([entry.name, "exec", [entry.path]])
+                    elif ext.lower() == ".desktop":
+                        app = parse_desktop_file(entry.path)
+                        if app:
+                            apps.append(list(app))
+                    elif ext.lower() in (".lnk", ".url", ".appref-ms"):
+                        apps.append([stem, "file", entry.path])
+                except OSError:
+                    continue
+        return apps, subdirs
+
+    # --- Building ---
+    def start(self):
+        """Loads the saved catalog and refreshes it on a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._build, name="app-catalog", daemon=True)
+            self._thread.start()
+
+    def _build(self):
+        try:
+            saved = load_state(self.path, {}) if self.path else {}
+            self._dirs = saved.get("dirs", {})
+            self._reindex()
+            if self._dirs:
+                self.ready.set() # Answer from the saved catalog while the refresh runs
+            if self.refresh():
+                self._save()
+        except Exception as e:
+            logging.error(f"App catalog build failed: {e}")
+        finally:
+            self.ready.set()
+
+    def refresh(self):
+        """Rescans directories whose mtime changed. Returns the number rescanned."""
+        started = perf_counter()
+        seen, rescanned = set(), 0
+        pending = list(self.source_dirs())
+        while pending:
+            directory, source, recursive = pending.pop()
+            if directory in seen:
+                continue
+            seen.add(directory)
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError:
+                continue
+            cached = self._dirs.get(directory)
+            if not cached or cached["mtime"] != mtime or cached["source"] != source:
+                try:
+                    apps, subdirs = self._scan_dir(directory, source)
+                except OSError:
+                    continue
+                cached = {"mtime": mtime, "source": source, "apps": apps, "subdirs": subdirs}
+                self._dirs[directory] = cached
+                rescanned += 1
+            if recursive:
+                pending += [(subdir, source, True) for subdir in cached["subdirs"]]
+        removed = set(self._dirs) - seen
+        for directory in removed:
+            del self._dirs[directory]
+        if rescanned or removed:
+            self._reindex()
+        logging.info(f"App catalog: {len(self._entries)} apps, {rescanned} of {len(seen)} directories rescanned "
+                     f"in {(perf_counter() - started) * 1000:.0f} ms")
+        return rescanned + len(removed)
+
+    def _save(self):
+        if self.path:
+            save_state(self.path, {"dirs": self._dirs})
+
+    @staticmethod
+    def trigrams(name):
+        padded = f"  {name} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    @classmethod
+    def normalize(cls, name):
+        words = re.findall(r"[a-z0-9+]+", name.lower())
+        while len(words) > 1 and words[0] in cls.FILLER_WORDS:
+            words = words[1:]
+        while len(words) > 1 and words[-1] in cls.FILLER_WORDS:
+            words = words[:-1]
+        return " ".join(words)
+
+    def _reindex(self):
+        entries = [(AppEntry(name, "file", path), "configured") for name, path in self.configured.items() if os.path.exists(path)]
+        for cached in self._dirs.values():
+            entries += [(AppEntry(*app), cached["source"]) for app in cached["apps"]
+                        if cached["source"] != "path" or app[0].lower().split(".")[0] not in self.PATH_DENYLIST]
+        names = [self.normalize(entry.name) for entry, _ in entries]
+        index = collections.defaultdict(set)
+        for position, name in enumerate(names):
+            for gram in self.trigrams(name):
+                index[gram].add(position)
+        with self._lock:
+            self._entries, self._names, self._index = entries, names, dict(index)
+
+    # --- Lookup & Launch ---
+    def __len__(self):
+        return len(self._entries)
+
+    def find(self, query, wait=2.0):
+        """Best AppEntry for a spoken name, or None if nothing is similar enough."""
+        self.ready.wait(wait)
+        query = self.normalize(query)
+        if not query:
+            return None
+        grams = self.trigrams(query)
+        with self._lock:
+            entries, names, index = self._entries, self._names, self._index
+        shared = collections.Counter()
+        for gram in grams:
+            for position in index.get(gram, ()):
+                shared[position] += 1
+
+        best, best_key = None, None
+        for position, common in shared.items():
+            name = names[position]
+            score = 2 * common / (len(grams) + len(self.trigrams(name))) # Dice coefficient
+            entry, source = entries[position]
+            if name == query:
+                score = 2.0
+            elif source == "path":
+                continue # Command-line tools are never matched fuzzily
+            elif name.startswith(query) or query in name.split():
+                score += 0.5 # "visual studio" -> "visual studio code"
+            if score < self.threshold:
+                continue
+            key = (score, -self.PRIORITY_KINDS.index(source), -len(name))
+            if best_key is None or key > best_key:
+                best, best_key = entry, key
+        return best
+
+    @staticmethod
+    def launch(entry):
+        """Starts the app detached from Jarvis, without waiting for it."""
+        if entry.kind == "exec":
+            if os.name == "nt":
+                detach = {"creationflags": subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+            else:
+                detach = {"start_new_session": True}
+            subprocess.Popen(entry.target, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL, **detach)
+        elif os.name == "nt":
+            os.startfile(entry.target)
+        else:
+            opener = "open" if sys.platform == "darwin" else "xdg-open"
+            subprocess.Popen([opener, entry.target], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                             start_new_session=True)
+
+
+# --- Volume Control ---
+class VolumeBackend:
+    """
+    Interface for system mixers. Levels are percentages (0-100).
+    get() may return None when the backend cannot read the level (media keys).
+    """
+    name = "base"
+
+    @staticmethod
+    def available():
+        return True
+
+    def get(self):
+        raise NotImplementedError
+
+    def set(self, percent):
+        raise NotImplementedError
+
+    def step(self, delta):
+        """Relative change; returns the new level."""
+        level = max(0, min(100, (self.get() or 0) + delta))
+        self.set(level)
+        return level
+
+    def mute(self, muted):
+        raise NotImplementedError
+
+
+class PycawVolumeBackend(VolumeBackend):
+    """Windows Core Audio through pycaw (optional: pip install pycaw)."""
+    name = "pycaw"
+
+    @staticmethod
+    def available():
+        return os.name == "nt" and importlib.util.find_spec("pycaw") is not None
+
+    def __init__(self):
+        self._endpoint = None
+        self._thread = None
+
+    def _get_endpoint(self):
+        # COM objects belong to the thread that created them, and commands may run on another thread next time
+        if self._endpoint is None or self._thread != threading.get_ident():
+            import comtypes
+            from ctypes import POINTER, cast
+            from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
+            comtypes.CoInitialize()
+            speakers = AudioUtilities.GetSpeakers()
+            endpoint = getattr(speakers, "EndpointVolume", None) # pycaw >= 20240210 wraps the device
+            if endpoint is None:
+                interface = speakers.Activate(IAudioEndpointVolume._iid_, comtypes.CLSCTX_ALL, None)
+                endpoint = cast(interface, POINTER(IAudioEndpointVolume))
+            self._endpoint = endpoint
+            self._thread = threading.get_ident()
+        return self._endpoint
+
+    def get(self):
+        return round(self._get_endpoint().GetMasterVolumeLevelScalar() * 100)
+
+    def set(self, percent):
+        self._get_endpoint().SetMasterVolumeLevelScalar(percent / 100, None)
+
+    def mute(self, muted):
+        self._get_endpoint().SetMute(int(muted), None)
+
+
+class CommandVolumeBackend(VolumeBackend):
+    """Base for mixers driven by a command-line tool; failures raise subprocess.SubprocessError or OSError."""
+    TOOL = None
+
+    @classmethod
+    def available(cls):
+        return os.name != "nt" and shutil.which(cls.TOOL) is not None
+
+    def _run(self, *args):
+        return subprocess.run((self.TOOL,) + args, capture_output=True, text=True, timeout=3, check=True).stdout
+
+    @staticmethod
+    def _percent(output):
+        match = re.search(r"(\d+)%", output)
+        if match is None:
+            raise ValueError(f"no volume level in {output!r}")
+        return int(match.group(1))
+
+
+class PactlVolumeBackend(CommandVolumeBackend):
+    """PulseAudio / PipeWire default sink."""
+    name = "pactl"
+    TOOL = "pactl"
+
+    def get(self):
+        return self._percent(self._run("get-sink-volume", "@DEFAULT_SINK@"))
+
+    def set(self, percent):
+        self._run("set-sink-volume", "@DEFAULT_SINK@", f"{percent}%")
+
+    def mute(self, muted):
+        self._run("set-sink-mute", "@DEFAULT_SINK@", "1" if muted else "0")
+
+
+class AmixerVolumeBackend(CommandVolumeBackend):
+    """ALSA Master control; -M uses the same perceptual scale as desktop volume sliders."""
+    name = "amixer"
+    TOOL = "amixer"
+
+    def get(self):
+        return self._percent(self._run("-M", "get", "Master"))
+
+    def set(self, percent):
+        self._run("-q", "-M", "set", "Master", f"{percent}%")
+
+    def mute(self, muted):
+        self._run("-q", "set", "Master", "mute" if muted else "unmute")
+
+
+class KeypressVolumeBackend(VolumeBackend):
+    """
+    Media keys through pyautogui, for systems without a mixer API. The level cannot be
+    read, so it is tracked from our own presses; each change is one batched press() call.
+    """
+    name = "keys"
+    KEY_STEP = 2 # Percent per volume key press (Windows)
+
+    def __init__(self):
+        self.level = None # Unknown until the first absolute set()
+
+    def get(self):
+        return self.level
+
+    def set(self, percent):
+        if self.level is None:
+            pyautogui.press("volumedown", presses=100 // self.KEY_STEP) # Bottom out to learn where we are
+            self.level = 0
+        self.step(percent - self.level)
+
+    def step(self, delta):
+        presses = round(abs(delta) / self.KEY_STEP)
+        if presses:
+            pyautogui.press("volumeup" if delta > 0 else "volumedown", presses=presses)
+        if self.level is not None:
+            self.level = max(0, min(100, self.level + presses * self.KEY_STEP * (1 if delta > 0 else -1)))
+        return self.level
+
+    def mute(self, muted):
+        # The mute key only toggles; a volume key always unmutes, so start from a known state
+        pyautogui.press("volumeup")
+        pyautogui.press("volumedown")
+        if muted:
+            pyautogui.press("volumemute")
+
+
+class FakeVolumeBackend(VolumeBackend):
+    """In-memory mixer for tests and headless machines; `calls` counts mixer operations."""
+    name = "fake"
+
+    def __init__(self, level=50):
+        self.level = level
+        self.muted = False
+        self.calls = 0
+
+    def get(self):
+        self.calls += 1
+        return self.level
+
+    def set(self, percent):
+        self.calls += 1
+        self.level = percent
+
+    def mute(self, muted):
+        self.calls += 1
+        self.muted = muted
+
+
+VOLUME_BACKENDS = {
+    "pycaw": PycawVolumeBackend,
+    "pactl": PactlVolumeBackend,
+    "amixer": AmixerVolumeBackend,
+    "keys": KeypressVolumeBackend,
+    "fake": FakeVolumeBackend,
+}
+
+
+def make_volume_backend(name=VOLUME_BACKEND):
+    """Builds a volume backend by name; "auto" (or an unknown name) takes the first one available here."""
+    backend_class = VOLUME_BACKENDS.get(name)
+    if backend_class is None:
+        if name != "auto":
+            logging.warning(f"Unknown volume backend '{name}', choosing one automatically.")
+        backend_class = next((cls for cls in (PycawVolumeBackend, PactlVolumeBackend, AmixerVolumeBackend)
+                              if cls.available()), KeypressVolumeBackend)
+    return backend_class()
+
+
+class VolumeControl:
+    """
+    Caches the level and mute state in front of a VolumeBackend, so a command costs
+    exactly one mixer operation. The cache expires after VOLUME_CACHE_SECONDS.
+    """
+    def __init__(self, backend=None, cache_seconds=VOLUME_CACHE_SECONDS):
+        self.backend = backend or make_volume_backend()
+        self.cache_seconds = cache_seconds
+        self.muted = None
+        self._level = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def level(self):
+        """The current level in percent (None if the backend cannot tell)."""
+        with self._lock:
+            return self._current()
+
+    def _current(self):
+        if self._level is None or time() - self._checked > self.cache_seconds:
+            self._remember(self.backend.get())
+        return self._level
+
+    def _remember(self, level):
+        self._level = level
+        self._checked = time()
+
+    def set(self, percent):
+        percent = max(0, min(100, int(percent)))
+        with self._lock:
+            self.backend.set(percent)
+            self._remember(percent)
+        return percent
+
+    def step(self, delta):
+        """Relative change in one mixer call when the level is cached. Returns the new level (None if unknown)."""
+        with self._lock:
+            level = self._level if self._level is not None and time() - self._checked <= self.cache_seconds else None
+            if level is None:
+                level = self.backend.step(delta)
+            else:
+                level = max(0, min(100, level + delta))
+                self.backend.set(level)
+            self._remember(level)
+        return level
+
+    def mute(self, muted):
+        """Sets the mute state explicitly (never a toggle, so "unmute" cannot mute)."""
+        with self._lock:
+            self.backend.mute(muted)
+            self.muted = muted
+
+
+NUMBER_WORDS = {word: value for value, word in enumerate(
+    "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen "
+    "fifteen sixteen seventeen eighteen nineteen".split())}
+NUMBER_WORDS.update({word: value for value, word in zip(range(20, 100, 10),
+                     "twenty thirty forty fifty sixty seventy eighty ninety".split())})
+LEVEL_WORDS = {"half": 50, "max": 100, "maximum": 100, "full": 100, "min": 0, "minimum": 0}
+
+
+def parse_level(text):
+    """Spoken level to a number: "50%", "50 percent", "seventy-five", "one hundred", "half". None if there is none."""
+    match = re.search(r"\d+", text)
+    if match:
+        return int(match.group())
+    total = None
+    for word in re.findall(r"[a-z]+", text.lower()):
+        if word in LEVEL_WORDS:
+            return LEVEL_WORDS[word]
+        if word in NUMBER_WORDS:
+            total = (total or 0) + NUMBER_WORDS[word]
+        elif word == "hundred":
+            total = (total or 1) * 100
+    return total
+
+
+# --- Intent Routing ---
+IntentMatch = collections.namedtuple("IntentMatch", ["intent", "slots", "phrase"])
+
+
+class IntentRouter:
+    """
+    Declarative registry of voice commands.
+    Each intent registers phrases such as "search google for {topic}"; a trailing
+    {slot} captures the rest of the query. All phrases are compiled into one token
+    trie, so matching costs a short walk per query word regardless of how many
+    commands exist. Whole words are compared, so "unmute" never hits "mute".
+    When several phrases match, the one starting earliest in the query wins, then
+    the one covering the most words (a {slot} covers the rest of the query), then
+    the intent registered first. So "search google for mute button" is a search,
+    and "what is the time complexity of quicksort" is not a clock query.
+    """
+    TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+    WAKE_WORDS = ("jarvis",)
+    FILLER_WORDS = ("hey", "hi", "ok", "okay", "please", "so", "now", "um", "uh") # Skipped before anchored phrases
+    _END = ""  # Trie key marking the end of a phrase (never produced by TOKEN_PATTERN)
+
+    def __init__(self):
+        self._trie = {}
+        self._handlers = {}
+        self._priority = {}
+
+    def register(self, intent, phrases, handler=None, anchored=False, exact=False, slot_pattern=None):
+        """
+        Adds phrases for an intent. `anchored` phrases only match at the start of the query,
+        `exact` ones only when they are the whole query, and a phrase with a `slot_pattern`
+        only when the slot text fully matches it. The handler is called with the IntentMatch.
+        """
+        priority = self._priority.setdefault(intent, len(self._priority))
+        for phrase in phrases:
+            words = phrase.lower().split()
+            slot = None
+            if words and words[-1].startswith("{") and words[-1].endswith("}"):
+                slot = words.pop()[1:-1]
+            node = self._trie
+            for word in words:
+                node = node.setdefault(word, {})
+            node.setdefault(self._END, []).append((priority, intent, slot, anchored or exact, phrase, exact, slot_pattern))
+        if handler:
+            self._handlers[intent] = handler
+
+    def handler(self, intent):
+        return self._handlers.get(intent)
+
+    def intents(self):
+        return list(self._priority)
+
+    def match(self, query):
+        """Returns the best IntentMatch for the query, or None."""
+        query = query.lower()
+        tokens = [(m.group(), m.end()) for m in self.TOKEN_PATTERN.finditer(query)]
+        first = 0
+        while first < len(tokens) and (tokens[first][0] in self.WAKE_WORDS or tokens[first][0] in self.FILLER_WORDS):
+            first += 1
+
+        best = None
+        for start in range(first, len(tokens)):
+            node = self._trie
+            for end in range(start, len(tokens)):
+                node = node.get(tokens[end][0])
+                if node is None:
+                    break
+                for entry in node.get(self._END, ()):
+                    if entry[3] and start != first or entry[5] and end != len(tokens) - 1:
+                        continue
+                    if entry[6] and not entry[6].fullmatch(query[tokens[end][1]:].strip()):
+                        continue
+                    # Longer phrases beat shorter ones here; ties go to the intent registered first
+                    covered = len(tokens) if entry[2] else end + 1
+                    if best is None or (-covered, entry[0]) < (-best[2], best[0][0]):
+                        best = (entry, tokens[end][1], covered)
+            if best is not None:
+                break # Nothing starting later can beat a match at this position
+        if best is None:
+            return None
+
+        (_, intent, slot, _, phrase, _, _), slot_start, _ = best
+        slots = {slot: query[slot_start:].strip()} if slot else {}
+        return IntentMatch(intent, slots, phrase)
+
+    def dispatch(self, query):
+        """Matches the query and runs its handler. Returns the IntentMatch, or None if nothing matched."""
+        match = self.match(query)
+        if match and match.intent in self._handlers:
+            self._handlers[match.intent](match)
+        return match
+
+
+# --- Command Execution ---
+class CommandCanceled(BaseException):
+    """
+    Raised inside a command whose CancelToken was canceled.
+    A BaseException (like asyncio.CancelledError) so handlers' `except Exception` blocks let it through.
+    """
+
+
+class CancelToken:
+    """Cooperative cancellation flag handed to a running command."""
+    def __init__(self):
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason="canceled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise CommandCanceled(self.reason)
+
+
+CommandTask = collections.namedtuple("CommandTask", ["seq", "intent", "token", "timer"])
+
+
+class ReplySequencer:
+    """
+    Releases command replies in the order the commands were given.
+    Every command opens a slot; whatever a command says while an earlier one is still
+    running is held back and released once everything before it has finished.
+    Closing a slot with discard=True drops its replies, and later ones are ignored.
+    A slot's on_released callback runs once all of its replies have gone out.
+    """
+    def __init__(self):
+        self._seqs = itertools.count()
+        self._head = 0
+        self._open = {}   # seq -> replies held back while earlier slots are open
+        self._closed = {} # seq -> replies of finished slots waiting for the head to reach them
+        self._on_released = {} # seq -> callback
+        self._lock = threading.RLock() # Replies are delivered under the lock to keep them in order
+
+    def open(self, on_released=None):
+        with self._lock:
+            seq = next(self._seqs)
+            self._open[seq] = []
+            if on_released:
+                self._on_released[seq] = on_released
+            return seq
+
+    def submit(self, seq, deliver):
+        """
+        deliver(held) runs now if seq is the oldest open slot, otherwise once it becomes so
+        (held=True). Returns False if the slot was already closed and the reply was dropped.
+        """
+        with self._lock:
+            held = self._open.get(seq)
+            if held is None:
+                return False
+            if seq == self._head:
+                deliver(False)
+            else:
+                held.append(deliver)
+            return True
+
+    def close(self, seq, discard=False):
+        released = []
+        with self._lock:
+            held = self._open.pop(seq, None)
+            if held is None:
+                return
+            self._closed[seq] = [] if discard else held
+            while self._head in self._closed:
+                for deliver in self._closed.pop(self._head):
+                    deliver(True)
+                released.append(self._on_released.pop(self._head, None))
+                self._head += 1
+            # The new head is still running: what it already said can go out now
+            for deliver in self._open.get(self._head, ()):
+                deliver(True)
+            if self._head in self._open:
+                self._open[self._head] = []
+        for callback in filter(None, released):
+            callback()
+
+    def pending(self):
+        with self._lock:
+            return len(self._open)
+
+
+class CommandExecutor:
+    """
+    Runs slow command handlers on a small thread pool so listening never waits on the network.
+    Each background task gets a CancelToken, a per-intent concurrency limit and a timeout;
+    cancel_all() aborts everything in flight. A task over its intent's limit waits in a
+    per-intent queue rather than on a pool thread, so one busy intent never starves the others. Fast commands run inline on the caller's thread
+    but still take a reply slot, so replies come out in the order the commands were heard.
+    """
+    def __init__(self, workers=COMMAND_WORKERS, intents=BACKGROUND_INTENTS, timeout=COMMAND_TIMEOUT, on_timeout=None):
+        self.workers = workers
+        self.intents = intents
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.replies = ReplySequencer()
+        self.completed = 0
+        self.canceled = 0
+        self.timed_out = 0
+        self._limits = {intent: limit for intent, (limit, _) in intents.items()}
+        self._running = collections.Counter() # intent -> slots taken
+        self._slots = set() # seqs of the tasks holding a slot
+        self._waiting = collections.defaultdict(collections.deque) # intent -> (task, handler) over the limit
+        self._tasks = {} # seq -> CommandTask
+        self._pool = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def runs_in_background(self, intent):
+        return intent in self.intents
+
+    def current(self):
+        """The CommandTask running on this thread, or None outside of commands."""
+        return getattr(self._local, "task", None)
+
+    def checkpoint(self):
+        """Raises CommandCanceled if the command running on this thread was canceled or timed out."""
+        task = self.current()
+        if task is not None:
+            task.token.raise_if_cancelled()
+
+    def run(self, intent, handler, on_released=None):
+        """
+        Runs handler() for the intent: inline for fast intents, on the pool for BACKGROUND_INTENTS.
+        on_released() is called once the command has finished and its replies have gone out.
+        """
+        if not self.runs_in_background(intent):
+            self._execute(self._open(intent, on_released=on_released), handler)
+            return
+        _, timeout = self.intents[intent]
+        task = self._open(intent, timeout or self.timeout, on_released)
+        task.timer.daemon = True
+        task.timer.start()
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="command")
+            limit = self._limits.get(intent)
+            if limit and self._running[intent] >= limit:
+                self._waiting[intent].append((task, handler)) # Submitted once a slot of this intent is released
+                return
+            self._running[intent] += 1
+            self._slots.add(task.seq)
+            pool = self._pool
+        pool.submit(self._execute, task, handler)
+
+    def _open(self, intent, timeout=None, on_released=None):
+        seq = self.replies.open(on_released)
+        timer = threading.Timer(timeout, self._expire, args=(seq,)) if timeout else None
+        task = CommandTask(seq, intent, CancelToken(), timer)
+        with self._lock:
+            self._tasks[task.seq] = task
+        return task
+
+    def _execute(self, task, handler):
+        self._local.task = task
+        try:
+            task.token.raise_if_cancelled()
+            handler()
+            self.completed += 1
+        except CommandCanceled as e:
+            self.canceled += 1
+            logging.info(f"Command '{task.intent}' stopped: {e}")
+        except Exception as e:
+            logging.error(f"Command '{task.intent}' failed: {e}")
+        finally:
+            self._local.task = None
+            if task.timer:
+                task.timer.cancel()
+            with self._lock:
+                self._tasks.pop(task.seq, None)
+            self._release(task)
+            self.replies.close(task.seq) # No-op if cancel_all() or the timeout already closed it
+
+    def _release(self, task):
+        """
+        Frees the task's slot and hands it to the next queued task of the same intent.
+        Safe to call more than once: a canceled or timed out task lets go of its slot right
+        away, even while its handler is still stuck on the network.
+        """
+        with self._lock:
+            if task.seq not in self._slots:
+                return
+            self._slots.discard(task.seq)
+            waiting = self._waiting[task.intent]
+            while waiting and waiting[0][0].token.cancelled:
+                waiting.popleft() # Canceled while queued: already closed, never runs
+            if not waiting:
+                self._running[task.intent] -= 1
+                return
+            task, handler = waiting.popleft()
+            self._slots.add(task.seq)
+            pool = self._pool
+        pool.submit(self._execute, task, handler)
+
+    def _expire(self, seq):
+        """Timer callback: gives the command a last word (on_timeout), then abandons it."""
+        with self._lock:
+            task = self._tasks.pop(seq, None)
+        if task is None:
+            return
+        self.timed_out += 1
+        logging.warning(f"Command '{task.intent}' timed out.")
+        if self.on_timeout:
+            self._local.task = task
+            try:
+                self.on_timeout(task)
+            finally:
+                self._local.task = None
+        task.token.cancel("timed out")
+        self._release(task)
+        self.replies.close(task.seq)
+
+    def cancel_all(self):
+        """Cancels every command in flight except the one calling. Returns how many were canceled."""
+        current = self.current()
+        with self._lock:
+            tasks = [task for task in self._tasks.values() if task is not current]
+            for task in tasks:
+                self._tasks.pop(task.seq)
+        for task in tasks:
+            task.token.cancel()
+        for task in tasks:
+            self._release(task)
+            self.replies.close(task.seq, discard=True)
+        return len(tasks)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._tasks)
+
+    def wait_idle(self, timeout=None):
+        """Blocks until no command is running. Returns False on timeout."""
+        deadline = None if timeout is None else perf_counter() + timeout
+        while self.in_flight():
+            if deadline is not None and perf_counter() > deadline:
+                return False
+            sleep(0.05)
+        return True
+
+    def shutdown(self):
+        self.cancel_all()
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# --- Status Light ---
+class StatusLight:
+    """
+    Animates the status indicator from a single Tk scheduler.
+    Any thread may call set_state(); the GUI thread applies it on its next tick.
+    The pulse palette is computed once, the canvas is only reconfigured when the
+    colour actually changes, and ticks slow down while the light is static, the
+    window is hidden, or the CPU is busy.
+    """
+    # state -> (colour, pulses); a pulsing state cycles through the palette
+    STATES = {
+        "off": ("#e74c3c", False),          # Red: not listening
+        "idle": (None, True),               # Pulsing yellow: ready for a command
+        "listening": ("#3498db", False),    # Blue: waiting for speech
+        "recognizing": ("#9b59b6", False),  # Purple: transcribing an utterance
+        "speaking": ("#2ecc71", False),     # Green: Jarvis is talking
+    }
+    PULSE_STEPS = 60
+    FRAME_MS = 25
+    BUSY_FRAME_MS = 100  # Pulse frame period while the CPU is busy
+    STATIC_TICK_MS = 100 # How often a static light checks for a new state
+    HIDDEN_TICK_MS = 500
+    CPU_BUSY_PERCENT = 80
+    CPU_SAMPLE_SECONDS = 2
+
+    def __init__(self, root, canvas, item, is_speaking=None):
+        self.root = root
+        self.canvas = canvas
+        self.item = item
+        self.is_speaking = is_speaking or (lambda: False)
+        self.state = "off"
+        self.palette = [f'#ff{int(220 + 35 * math.sin(step / 30 * math.pi * 2)):02x}00' for step in range(self.PULSE_STEPS)]
+        self.redraws = 0
+        self._step = 0
+        self._drawn = None
+        self._job = None
+        self._cpu_busy = False
+        self._cpu_checked = 0.0
+
+    def set_state(self, state):
+        """Thread-safe: only records the state, the scheduler draws it."""
+        self.state = state
+
+    def start(self):
+        if self._job is None:
+            self._tick()
+
+    def stop(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _frame_ms(self):
+        now = time()
+        if now - self._cpu_checked > self.CPU_SAMPLE_SECONDS:
+            self._cpu_checked = now
+            try:
+                self._cpu_busy = psutil.cpu_percent(interval=None) > self.CPU_BUSY_PERCENT
+            except Exception:
+                self._cpu_busy = False
+        return self.BUSY_FRAME_MS if self._cpu_busy else self.FRAME_MS
+
+    def _tick(self):
+        state = self.state
+        if state != "off" and self.is_speaking():
+            state = "speaking"
+        color, pulses = self.STATES.get(state, self.STATES["off"])
+
+        if not self.root.winfo_viewable():
+            delay = self.HIDDEN_TICK_MS
+        else:
+            if pulses:
+                color = self.palette[self._step]
+                self._step = (self._step + 1) % self.PULSE_STEPS
+                delay = self._frame_ms()
+            else:
+                self._step = 0
+                delay = self.STATIC_TICK_MS
+            if color != self._drawn:
+                self.canvas.itemconfig(self.item, fill=color, outline=color)
+                self._drawn = color
+                self.redraws += 1
+
+        self._job = self.root.after(delay, self._tick)
+
+
+# --- Command Input Sources ---
+class MicrophoneInput:
+    """
+    Live microphone: a session-long AudioCapture feeding a RecognitionPool.
+    Without a fixed device_index the device is chosen by MicrophoneProbe, and capture
+    fails over to the next-best device as soon as the current one stops working.
+    """
+    interrupts_speech = True # A new spoken command cuts off the reply still playing
+
+    def __init__(self, device_index=MIC_DEVICE_INDEX, backend=None, probe=None):
+        self.device_index = device_index
+        self.backend = backend
+        self.probe = probe
+        self.ranking = None # Device profiles, best first; decided on the first start()
+        self.engine = None
+        self.capture = None
+        self.recognition = None
+        self._lock = threading.Lock()
+
+    def describe(self):
+        device = self.ranking[0] if self.ranking else {"index": self.device_index}
+        if device.get("name"):
+            return f"{device['name']} (device {device['index']})"
+        return "the default device" if device["index"] is None else f"device {device['index']}"
+
+    def start(self, engine):
+        """Opens the stream and the recognizer pool if they are not running (called every turn)."""
+        self.engine = engine
+        if self.recognition is None:
+            self.recognition = RecognitionPool(self.backend or make_recognizer_backend(), stages=make_audio_stages())
+            self.recognition.start()
+        with self._lock:
+            if self.ranking is None:
+                self.ranking = self._rank_devices()
+            if self.capture is None or not self.capture.is_running():
+                self._open_capture()
+
+    def _rank_devices(self):
+        if self.device_index is not None:
+            return [{"index": self.device_index}]
+        if self.probe is None:
+            self.probe = MicrophoneProbe()
+        try:
+            ranking = self.probe.rank()
+        except Exception as e:
+            logging.warning(f"Microphone probe failed, using the default device: {e}")
+            ranking = []
+        if ranking:
+            best = ranking[0]
+            logging.info(f"Microphone: {best['name']} (device {best['index']}, SNR {best['snr_db']} dB, "
+                         f"{len(ranking) - 1} fallback(s))")
+        return ranking or [{"index": None}]
+
+    def _open_capture(self):
+        """Starts capture on the best remaining device, moving down the ranking while devices fail to open."""
+        while True:
+            device = self.ranking[0]
+            rates = device.get("rates")
+            capture = AudioCapture(device["index"], is_speaking=self.engine.is_speaking,
+                                   on_utterance=self._on_utterance, sample_rate=rates[0] if rates else None,
+                                   noise_floor=device.get("noise_floor") or None, on_error=self._on_capture_error)
+            try:
+                capture.start()
+            except Exception as e:
+                if not self._drop_device(e):
+                    raise
+                continue
+            self.capture = capture
+            return
+
+    def _drop_device(self, error):
+        """Removes the failing device from the ranking. False if it was the last one."""
+        if len(self.ranking) < 2:
+            return False
+        failed = self.ranking.pop(0)
+        if failed.get("fingerprint") and self.probe:
+            self.probe.forget(failed["fingerprint"])
+        self.engine.update_log(f"⚠️ Microphone {failed.get('name', failed['index'])} failed ({error}), "
+                               f"switching to {self.describe()}.")
+        return True
+
+    def _on_capture_error(self, error):
+        """Called from the dying capture thread: switch devices right away instead of on the next turn."""
+        with self._lock:
+            if self.capture is None or self.capture.error is not error or not self._drop_device(error):
+                return
+            try:
+                self._open_capture()
+            except Exception as e:
+                logging.error(f"No working microphone left: {e}")
+                self.capture.error = e
+
+    def _on_utterance(self, audio, overlapped=False):
+        """Called from the capture thread: queue the utterance for recognition and keep listening."""
+        self.engine.update_log("🧠 Recognizing...")
+        self.engine.set_status("recognizing")
+        self.recognition.submit(audio, tag=self.engine.tracer.begin_turn(), overlapped=overlapped)
+
+    def pending(self):
+        return self.recognition.pending() if self.recognition else 0
+
+    def get(self, timeout):
+        try:
+            return self.recognition.get(timeout=timeout)
+        except sr.WaitTimeoutError:
+            if self.capture and self.capture.error:
+                raise self.capture.error
+            raise
+
+    def stop(self):
+        with self._lock:
+            capture, self.capture = self.capture, None
+        if capture:
+            capture.stop()
+        if self.recognition:
+            self.recognition.stop()
+            self.recognition = None
+
+
+class AudioFileInput:
+    """Recorded WAV/AIFF/FLAC files, recognized in order through a RecognitionPool. Ends after the last file."""
+    interrupts_speech = False # Files are read ahead, so every reply is queued and played in full
+    def __init__(self, paths, backend=None):
+        self.paths = list(paths)
+        self.backend = backend
+        self.recognition = None
+        self._delivered = 0
+
+    def describe(self):
+        return f"{len(self.paths)} audio file(s)"
+
+    def start(self, engine):
+        if self.recognition is not None:
+            return
+        self.recognition = RecognitionPool(self.backend or make_recognizer_backend(), stages=make_audio_stages())
+        self.recognition.start()
+        recognizer = sr.Recognizer()
+        for path in self.paths:
+            with sr.AudioFile(path) as source:
+                audio = recognizer.record(source)
+            self.recognition.submit(audio, tag=engine.tracer.begin_turn())
+
+    def pending(self):
+        return self.recognition.pending() if self.recognition else 0
+
+    def get(self, timeout):
+        if self._delivered >= len(self.paths):
+            raise EOFError("no more audio files")
+        transcript = self.recognition.get(timeout=timeout)
+        self._delivered += 1
+        return transcript
+
+    def stop(self):
+        if self.recognition:
+            self.recognition.stop()
+            self.recognition = None
+
+
+class TextInput:
+    """Typed or scripted commands, one per line (a list, a file or sys.stdin). Ends at end of input."""
+    interrupts_speech = False # Commands are read ahead, so every reply is queued and played in full
+    _EOF = object()
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.engine = None
+        self._queue = queue.Queue()
+        self._reader = None
+        self._seq = itertools.count()
+
+    def describe(self):
+        return "text input"
+
+    def start(self, engine):
+        self.engine = engine
+        if self._reader is None:
+            self._reader = threading.Thread(target=self._read, name="text-input", daemon=True)
+            self._reader.start()
+
+    def _read(self):
+        for line in self.lines:
+            line = line.strip()
+            if line:
+                self._queue.put(line)
+        self._queue.put(self._EOF)
+
+    def pending(self):
+        return 0
+
+    def get(self, timeout):
+        try:
+            line = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            raise sr.WaitTimeoutError("no command typed")
+        if line is self._EOF:
+            raise EOFError("end of text input")
+        # A turn starts when the command is picked up, not when it was read ahead
+        return Transcript(next(self._seq), line, None, 0.0, self.engine.tracer.begin_turn())
+
+    def stop(self):
+        pass
+
+
+# --- Assistant Engine ---
+class JarvisEngine:
+    """
+    The assistant core: input (capture + recognition), dispatch, command handlers and TTS.
+    It has no GUI dependency; front ends drive it with run()/start()/stop() and subscribe
+    to events with on(event, callback):
+        "log" (message), "status" (light state), "listening" (),
+        "command" (query), "reply" (text), "stopped" ()
+    """
+    EVENTS = ("log", "status", "listening", "command", "reply", "stopped")
+
+    def __init__(self, input_source=None, speech=True, tracer=None):
+        """
+        input_source: MicrophoneInput (default), AudioFileInput or TextInput.
+        speech: True for the default SpeechWorker, a SpeechWorker instance, or None/False for text-only replies.
+        """
+        self._listeners = {event: [] for event in self.EVENTS}
+        self.input = input_source or MicrophoneInput()
+        self.tracer = tracer or LatencyTracer()
+        self.browser = BrowserSession()
+        self.http = HttpClient()
+        self.news = NewsService(self.http)
+        self.knowledge = self._open_knowledge_cache()
+        self.jarvis_thread = None
+        self.stop_jarvis_event = threading.Event()
+        self._running = False
+        self._announced_listening = False
+
+        # --- Interrupt Flag for streamed AI replies ---
+        self.ai_stream_cancel = threading.Event()
+
+        # --- Gemini model, created on first use and reused ---
+        self.gemini_model = None
+        self._gemini_lock = threading.Lock()
+        self.memory = ConversationMemory(summarizer=self._summarize_conversation)
+
+        # --- Knowledge questions race the local caches, Wikipedia and Gemini ---
+        self.racer = AnswerRacer({"wikipedia": self._wikipedia_answer, "gemini": self._gemini_answer},
+                                 local=self._local_answer)
+
+        # 🛑 ACTION REQUIRED (STEP 2): Update "YourUsername" to your Dell laptop's Windows username 🛑
+        # Find your username by opening File Explorer and going to "C:\Users\"
+        # Change "YourUsername" below to match your folder name (e.g., "C:\\Users\\tanmaydell\\...")
+        self.software_paths = {
+            "visual studio code": "C:\\Users\\YourUsername\\AppData\\Local\\Programs\\Microsoft VS Code\\Code.exe",
+            "vscode": "C:\\Users\\YourUsername\\AppData\\Local\\Programs\\Microsoft VS Code\\Code.exe",
+            "notepad": "C:\\Windows\\System32\\notepad.exe",
+            "chrome": "C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe"
+        }
+
+        # --- Installed applications, indexed in the background (configured paths win ties) ---
+        self.apps = AppCatalog(configured=self.software_paths)
+        self.apps.start()
+
+        # --- System volume (mixer backend chosen on first use) ---
+        self._volume = None
+
+        # --- Text-to-Speech Worker (owns the pyttsx3 engine) ---
+        if speech is True:
+            speech = self._create_speech_worker()
+        self.speech = speech or None
+        if self.speech:
+            self.speech.start()
+
+        # --- Command handlers run here; replies are released in command order ---
+        self.executor = CommandExecutor(on_timeout=self._on_command_timeout)
+
+        self.router = self._build_router()
+
+    def _open_knowledge_cache(self):
+        sources = {}
+        if WIKIPEDIA_API_URL:
+            wiki = WikipediaRestClient(self.http)
+            sources = {"fetcher": wiki.summary, "related": wiki.related}
+        try:
+            return KnowledgeCache(**sources)
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"Knowledge cache on disk unavailable ({e}), keeping it in memory.")
+            return KnowledgeCache(":memory:", **sources)
+
+    def _create_speech_worker(self):
+        try:
+            phrase_cache = PhraseCache()
+        except OSError as e:
+            logging.warning(f"Phrase cache disabled: {e}")
+            phrase_cache = None
+        prerender = [(text, *EMOTION_VOICES[emotion]) for text, emotion in FIXED_PHRASES]
+        return SpeechWorker(phrase_cache=phrase_cache, prerender=prerender, tracer=self.tracer)
+
+    # --- EVENTS ---
+    def on(self, event, callback):
+        """Subscribes a callback to an engine event (see the class docstring)."""
+        self._listeners[event].append(callback)
+
+    def emit(self, event, *args):
+        for callback in self._listeners[event]:
+            try:
+                callback(*args)
+            except Exception as e:
+                logging.error(f"'{event}' listener failed: {e}")
+
+    def update_log(self, message):
+        """Logs a message and passes it to every front end (thread-safe)."""
+        logging.info(message)
+        self.emit("log", message)
 
-        self._setup_gui()
-        self.set_status_color(self.listening_color) 
+    def set_status(self, state):
+        self.emit("status", state)
 
     # --- EMOTION/TTS METHODS ---
-    
-    def speak_interruptible(self, text):
+
+    def speak_interruptible(self, text, interrupt=True, rate=TTS_RATE, volume=TTS_VOLUME,
+                            priority=SpeechWorker.PRIORITY_NORMAL):
         """
-        Handles the actual, non-blocking TTS. 
-        It stops any ongoing speech before starting a new one.
+        Queues text on the speech worker without blocking.
+        By default it stops any ongoing speech first; with interrupt=False the text is
+        queued behind the current speech instead (used for streamed replies).
         """
-        if not self.engine:
+        if not self._tts_available():
             self.update_log("Error: TTS engine not initialized.")
             return
 
-        # 1. Ensure any previous speech is stopped immediately
-        self.stop_speech()
+        interrupt = interrupt and getattr(self.input, "interrupts_speech", True)
+        turn = self.tracer.current_turn()
+        # Replies held behind an earlier command queue up after it instead of cutting it off,
+        # at normal priority so they cannot overtake what that command already queued
+        self._release(lambda held: self._say(text, interrupt and not held, rate, volume,
+                                             SpeechWorker.PRIORITY_NORMAL if held else priority, turn))
 
-        # 2. Define the TTS task
-        def tts_task():
-            self.is_speaking = True
-            try:
-                self.engine.say(text)
-                self.engine.runAndWait()
-            except Exception as e:
-                logging.error(f"TTS thread error: {e}")
-            finally:
-                self.is_speaking = False
-                
-        # 3. Execute the TTS task in a new thread
+    def _release(self, deliver):
+        """Delivers a reply now, or holds it until every earlier command has replied (see ReplySequencer)."""
+        task = self.executor.current()
+        if task is None:
+            deliver(False)
+        else:
+            self.executor.replies.submit(task.seq, deliver)
+
+    def _say(self, text, interrupt, rate, volume, priority, turn):
+        if interrupt:
+            self._halt_speech()
         self.update_log(f"Jarvis 🎧: {text}")
-        self.speak_thread = threading.Thread(target=tts_task)
-        self.speak_thread.daemon = True
-        self.speak_thread.start()
+        self.emit("reply", text)
+        if self._tts_available():
+            self.speech.say(text, rate, volume, priority, turn=turn)
+        else:
+            self.tracer.mark_first("first_audio", turn)
 
     def stop_speech(self):
-        """Stops the current TTS output immediately."""
-        if self.engine and self.is_speaking:
-            # pyttsx3.Engine.stop() is thread-safe for stopping speech
-            self.engine.stop() 
-            self.is_speaking = False
-            if self.speak_thread and self.speak_thread.is_alive():
-                # Wait briefly for the thread to clean up
-                self.speak_thread.join(timeout=0.1) 
+        """Stops the current TTS output immediately and cancels every command still running (and its replies)."""
+        self.ai_stream_cancel.set()
+        if self.executor.cancel_all():
+            self.update_log("Jarvis: Canceled the running commands.")
+        self._halt_speech()
+
+    def checkpoint(self):
+        """Called by slow handlers between steps: raises CommandCanceled once their command was canceled."""
+        self.executor.checkpoint()
+
+    def _halt_speech(self):
+        """Stops the current and queued TTS output."""
+        if self.speech and self.speech.cancel():
             self.update_log("Jarvis: Interrupted/Stopped talking.")
 
+    def is_speaking(self):
+        return bool(self.speech and self.speech.is_speaking)
+
+    def _tts_available(self):
+        return self.speech is not None and not self.speech.failed
 
-    def speak(self, text):
+    def speak(self, text, priority=SpeechWorker.PRIORITY_NORMAL):
         """Standard method for text-to-speech."""
-        if self.engine:
-            self.speak_interruptible(text)
+        if self._tts_available():
+            self.speak_interruptible(text, priority=priority)
         else:
-            self.update_log(f"Jarvis 🎧: {text}")
+            turn = self.tracer.current_turn()
+            self._release(lambda held: self._say(text, False, TTS_RATE, TTS_VOLUME, priority, turn))
 
-    def speak_emotionally(self, text, emotion="normal"):
+    def speak_emotionally(self, text, emotion="normal", interrupt=True, priority=SpeechWorker.PRIORITY_NORMAL):
         """
         Modulates speech rate and volume to simulate emotion, then calls the interruptible speak method.
+        The rate and volume travel with the utterance, so they never leak into other speech.
         """
-        if not self.engine:
-            self.speak(text) 
+        if not self._tts_available():
+            self.speak(text, priority)
             return
 
-        original_rate = 180 
-        original_volume = 1.0 
+        rate, volume = EMOTION_VOICES.get(emotion, EMOTION_VOICES["normal"])
+        self.speak_interruptible(text, interrupt=interrupt, rate=rate, volume=volume, priority=priority)
 
-        if emotion == "excited":
-            self.engine.setProperty('rate', original_rate + 40) 
-            self.engine.setProperty('volume', 1.0) 
-        elif emotion == "happy":
-            self.engine.setProperty('rate', original_rate + 20) 
-            self.engine.setProperty('volume', 1.0) 
-        elif emotion == "worry":
-            self.engine.setProperty('rate', original_rate - 40) 
-            self.engine.setProperty('volume', 0.65) 
-        else: # normal
-            self.engine.setProperty('rate', original_rate) 
-            self.engine.setProperty('volume', original_volume)
-
-        # Use the non-blocking speak method
-        self.speak_interruptible(text)
-
-        # Reset engine properties (these reset before the speech finishes, but will apply to the NEXT speak)
-        self.engine.setProperty('rate', 180)
-        self.engine.setProperty('volume', 1.0)
-
-
-    # --- GUI & ANIMATION METHODS ---
-    def set_status_color(self, color_hex):
-        """Changes the color of the status indicator light (thread-safe)."""
-        if self.status_light:
-            self.root.after(0, lambda: self.status_light.itemconfig(self.status_circle, fill=color_hex, outline=color_hex))
-
-    def animate_status_pulse(self, step=0):
-        """Recursively animates the status light (pulsing yellow) when ready for a command."""
+    def take_command(self):
+        """Returns the next recognized command; the input source keeps capturing and recognizing in the background."""
         if self.stop_jarvis_event.is_set():
-            return
-        
-        brightness = int(220 + 35 * math.sin(step / 30 * math.pi * 2)) 
-        hex_color = f'#ff{brightness:02x}00' 
-        
-        self.set_status_color(hex_color)
-        
-        next_step = (step + 1) % 60
-        self.pulse_job = self.root.after(25, lambda: self.animate_status_pulse(next_step))
-
-    def stop_status_pulse(self):
-        """Stops the recursive animation job."""
-        if hasattr(self, 'pulse_job') and self.pulse_job is not None:
-            self.root.after_cancel(self.pulse_job)
-            self.pulse_job = None
-    
-    def _setup_gui(self):
-        """Creates and configures the graphical user interface."""
-        ctk.set_appearance_mode("dark")
-        ctk.set_default_color_theme("blue") 
-
-        main_frame = ctk.CTkFrame(self.root)
-        main_frame.pack(fill="both", expand=True, padx=10, pady=10)
-
-        title = ctk.CTkLabel(main_frame, text="AI Voice Assistant", font=("Arial", 32, "bold"), text_color="#E0E0E0")
-        title.pack(pady=(20, 10))
-
-        self.status_light = ctk.CTkCanvas(main_frame, width=20, height=20, bg="#2b2b2b", highlightthickness=0)
-        self.status_circle = self.status_light.create_oval(5, 5, 15, 15, fill=self.listening_color, outline=self.listening_color)
-        self.status_light.pack(pady=(0, 10))
-
-        self.log_box = ctk.CTkTextbox(main_frame, font=("Consolas", 14), state="disabled", wrap="word", fg_color="#1e1e1e") 
-        self.log_box.pack(fill="both", expand=True, padx=10, pady=10)
+              return "stop"
 
-        button_frame = ctk.CTkFrame(main_frame)
-        button_frame.pack(pady=20, fill="x", padx=10)
+        try:
+            try:
+                self.input.start(self)
+            finally:
+                if not self._announced_listening:
+                    self._announced_listening = True
+                    self.emit("listening")
 
-        self.start_btn = ctk.CTkButton(
-            button_frame, text="Start Listening", command=self.start_jarvis_thread, 
-            width=200, height=40, font=("Helvetica", 14, "bold"),
-            fg_color="#2ecc71", hover_color="#27ae60" 
-        )
-        self.start_btn.pack(side="left", expand=True, padx=10)
+            if not self.input.pending():
+                self.update_log(f"🎤 Listening on {self.input.describe()}...")
+            self.set_status("listening") # Solid blue for listening
 
-        self.stop_btn = ctk.CTkButton(
-            button_frame, text="Stop Listening", command=self.stop_jarvis, 
-            width=200, height=40, font=("Helvetica", 14, "bold"), 
-            state="disabled", fg_color="#e74c3c", hover_color="#c0392b"
-        )
-        self.stop_btn.pack(side="right", expand=True, padx=10)
-        
-        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+            transcript = self.input.get(timeout=5)
 
-    def update_log(self, message):
-        """Thread-safe method to update the GUI log box and console."""
-        def _update():
-            self.log_box.configure(state="normal")
-            self.log_box.insert("end", message + "\n")
-            self.log_box.configure(state="disabled")
-            self.log_box.see("end")
-            logging.info(message) 
-        self.root.after(0, _update)
+            self.set_status("idle") # Restart pulse after listening attempt
 
-    def take_command(self):
-        """Listens for voice commands using the correct microphone device."""
-        if self.stop_jarvis_event.is_set():
-              return "stop"
-              
-        recognizer = sr.Recognizer()
-        
-        try:
-            # Stop speaking so the microphone can listen cleanly
-            self.stop_speech()
-            
-            with sr.Microphone(device_index=MIC_DEVICE_INDEX) as source:
-                self.update_log(f"🎤 Listening on device {MIC_DEVICE_INDEX}...")
-                recognizer.pause_threshold = 1.0
-                recognizer.adjust_for_ambient_noise(source, duration=1)
-                
-                self.stop_status_pulse()
-                self.set_status_color("#3498db") # Solid blue for listening
-                
-                audio = recognizer.listen(source, timeout=5, phrase_time_limit=10)
-            
-            self.animate_status_pulse() # Restart pulse after listening attempt
-            
+        except EOFError:
+            self.update_log("End of input.")
+            self.executor.wait_idle() # Let the last commands finish and reply
+            self.stop_jarvis_event.set()
+            return "stop"
         except ValueError:
-            self.speak_emotionally("Error: Microphone index is incorrect. Please check MIC_DEVICE_INDEX in the code.", "worry")
-            self.stop_status_pulse()
+            self.speak_emotionally("Error: Microphone index is incorrect. Please check JARVIS_MIC_INDEX.", "worry")
+            self.set_status("off")
             return "None"
         except sr.WaitTimeoutError:
+            if self.input.pending():
+                return "None" # Still recognizing, keep waiting on the next turn
             self.update_log("Timeout waiting for speech.")
-            self.animate_status_pulse()
+            self.set_status("idle")
             return "None"
         except Exception as e:
-            self.speak_emotionally(f"Microphone error. Is PyAudio installed correctly? Error: {e}", "wory")
-            self.stop_status_pulse()
+            self.speak_emotionally(f"Microphone error. Is PyAudio installed correctly? Error: {e}", "worry")
+            self.set_status("off")
             return "None"
 
-        try:
-            self.update_log("🧠 Recognizing...")
-            query = recognizer.recognize_google(audio, language='en-in')
-            self.update_log(f"🗣️ You said: {query}")
-            return query.lower()
-        except sr.UnknownValueError:
+        self.tracer.set_current(transcript.tag)
+        for stage, seconds in (transcript.stages or {}).items():
+            self.tracer.record(stage, seconds)
+        if isinstance(transcript.error, AudioRejected):
+            # Not speech (or no wake word): nothing was sent for recognition, so stay quiet
+            logging.debug(f"Utterance dropped before recognition: {transcript.error}")
+            self.tracer.set_intent("gated")
+            self.tracer.end_turn()
+            return "None"
+        self.tracer.record("recognize", transcript.latency)
+        self.tracer.mark_first("transcript")
+        if transcript.error:
+            self.tracer.set_intent("unrecognized")
+            self.tracer.end_turn()
+        if isinstance(transcript.error, sr.UnknownValueError):
             print("Sorry, I didn't catch that. Please try again.", "worry")
             return "None"
-        except sr.RequestError as e:
-            self.speak_emotionally(f"Network error: {e}", "worry")
+        if transcript.error:
+            self.speak_emotionally(f"Network error: {transcript.error}", "worry")
             return "None"
+        if transcript.overlapped:
+            match = self.router.match(transcript.text.lower())
+            if match is None or match.intent not in BARGE_IN_INTENTS:
+                # Heard while Jarvis was talking: most likely its own reply coming back through the mic
+                logging.debug(f"Ignored speech heard during a reply: {transcript.text}")
+                self.tracer.set_intent("echo")
+                self.tracer.end_turn()
+                return "None"
+        self.update_log(f"🗣️ You said: {transcript.text}")
+        return transcript.text.lower()
 
     # --- Utility and Command Functions ---
-    
-    def control_volume(self, action):
-        """Controls system volume using pyautogui key presses."""
+
+    @property
+    def volume(self):
+        if self._volume is None:
+            self._volume = VolumeControl()
+            logging.info(f"Volume backend: {self._volume.backend.name}")
+        return self._volume
+
+    def control_volume(self, action, amount=None):
+        """Changes the system volume with one mixer operation (see VolumeControl). `amount` is in percent."""
         try:
+            level = None
             if action == "increase":
                 self.speak("Turning up the volume.")
-                # Press the Volume Up key 5 times for a noticeable increase
-                for _ in range(5):
-                    pyautogui.press('volumeup')
+                level = self.volume.step(amount or VOLUME_STEP)
             elif action == "decrease":
                 self.speak("Turning down the volume.")
-                # Press the Volume Down key 5 times
-                for _ in range(5):
-                    pyautogui.press('volumedown')
+                level = self.volume.step(-(amount or VOLUME_STEP))
+            elif action == "set":
+                level = self.volume.set(amount)
+                self.speak(f"Volume set to {level} percent.")
             elif action == "mute":
                 self.speak("Muting the system.")
-                pyautogui.press('volumemute')
+                self.volume.mute(True)
             elif action == "unmute":
                 self.speak("Unmuting the system.")
-                pyautogui.press('volumemute') # Pressing it again toggles mute off
+                self.volume.mute(False)
             else:
                 self.speak_emotionally(f"Sorry, I don't know how to {action} the volume.", "worry")
+            if level is not None:
+                self.update_log(f"🔊 Volume: {level}%")
         except Exception as e:
             self.speak_emotionally(f"I ran into an error trying to change the volume: {e}", "worry")
-            
+
+    def _cmd_volume_set(self, match):
+        level = parse_level(match.slots["level"])
+        if level is None:
+            self.speak_emotionally("Sorry, what level should I set the volume to?", "worry")
+            return
+        self.control_volume("set", level)
+
+    def _cmd_volume_step(self, match):
+        amount = parse_level(match.slots["amount"])
+        direction = "decrease" if re.search(r"\b(down|decrease|lower)\b", match.phrase) else "increase"
+        self.control_volume(direction, amount)
+
     # ... (other utility functions remain the same) ...
 
-    def _init_chrome(self):
-        """Initializes and returns a single, reusable Chrome browser instance."""
-        if not self.driver:
-            try:
-                self.speak("Opening browser...")
-                options = webdriver.ChromeOptions()
-                options.add_argument("--start-maximized")
-                options.add_argument("--log-level=3") 
-                options.add_experimental_option("excludeSwitches", ["enable-logging"])
-                self.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-            except Exception as e:
-                self.speak_emotionally(f"Failed to open Chrome. Ensure Chrome is installed and updated: {e}", "worry")
-                self.driver = None
-        return self.driver
-    
     def search_google(self, topic):
-        """Uses Selenium to search Google in the running browser instance."""
-        driver = self._init_chrome()
-        if driver:
-            try:
-                self.speak(f"Searching Google for {topic}")
-                driver.get("https.www.google.com/search?q=" + topic)
-            except Exception as e:
-                self.speak_emotionally(f"Failed to perform Google search: {e}", "worry")
+        """Uses Selenium to search Google in the shared browser session."""
+        if not self.browser.is_open() and not self.browser.is_starting():
+            self.speak("Opening browser...")
+        driver = self.browser.get()
+        if not driver:
+            self.speak_emotionally(f"Failed to open Chrome. Ensure Chrome is installed and updated: {self.browser.last_error}", "worry")
+            return
+        self.checkpoint() # Chrome may have taken a while; don't search if the user canceled meanwhile
+        try:
+            self.speak(f"Searching Google for {topic}")
+            driver.get(f"{GOOGLE_SEARCH_URL}?q={quote_plus(topic)}")
+        except Exception as e:
+            self.speak_emotionally(f"Failed to perform Google search: {e}", "worry")
                 
     def get_news_headlines(self):
         """Fetches and speaks the top 3 news headlines using the News API."""
@@ -356,12 +3564,10 @@ class JarvisApp:
             return
         
         try:
-            self.speak("Fetching the top news headlines for you.")
-            url = f"https{os.getenv('NEWS_API_URL')}?country=us&apiKey={NEWS_API_KEY}" 
-            
-            response = requests.get(url, timeout=10)
-            response.raise_for_status() 
-            data = response.json()
+            if not self.news.has_fresh():
+                self.speak("Fetching the top news headlines for you.")
+            data = self.news.fetch()
+            self.checkpoint()
             
             if data['status'] == 'ok' and data['totalResults'] > 0:
                 headlines = [article['title'] for article in data['articles'][:3]]
@@ -382,44 +3588,83 @@ class JarvisApp:
 
 
     def close_browser(self):
-        if self.driver:
+        if self.browser.is_open():
             self.speak("Closing the browser.")
-            self.driver.quit()
-            self.driver = None
+        self.browser.close()
             
     def open_software(self, software_name):
-        """Robustly opens a software application based on a predefined path."""
-        path = self.software_paths.get(software_name.lower().strip())
-        
-        if path and os.path.exists(path):
-            try:
-                self.speak_emotionally("Launching application now, sir.", "happy") 
-                os.startfile(path)
-            except Exception as e:
-                self.speak_emotionally(f"Sorry, I encountered an error while trying to open {software_name}: {e}", "worry")
-        elif path:
-              self.speak_emotionally(f"The file path for {software_name} is configured but the file does not exist. Please check your software paths.", "worry")
-        else:
-            self.speak(f"Sorry, I don't have a configured path for {software_name}.")
+        """Opens the installed application whose name best matches software_name (see AppCatalog)."""
+        app = self.apps.find(software_name)
+        if app is None:
+            self.speak_emotionally(f"Sorry, I couldn't find an application called {software_name}.", "worry")
+            return
+        try:
+            self.apps.launch(app)
+            self.speak_emotionally(f"Launching {app.name} now, sir.", "happy")
+        except Exception as e:
+            self.speak_emotionally(f"Sorry, I encountered an error while trying to open {app.name}: {e}", "worry")
 
     def get_wikipedia_summary(self, topic):
-        """Fetches and speaks a summary from Wikipedia."""
+        """Speaks a Wikipedia summary, answering from the local knowledge cache when possible."""
         try:
-            self.speak("Searching Wikipedia...")
-            summary = wikipedia.summary(topic, sentences=2, auto_suggest=True)
-            self.speak_emotionally(f"According to Wikipedia: {summary}")
-        except wikipedia.exceptions.PageError:
-            self.speak_emotionally(f"Sorry, I couldn't find anything on Wikipedia about {topic}.", "worry")
+            entry = self.knowledge.lookup(topic)
+            if entry is None:
+                self.speak("Searching Wikipedia...")
+                entry = self.knowledge.get(topic)
+                self.checkpoint()
+            self.speak_emotionally(f"According to Wikipedia: {entry.summary}")
         except Exception as e:
-            self.speak_emotionally(f"An error occurred while accessing Wikipedia: {e}", "worry")
+            # Only the wikipedia package raises PageError; in REST mode it may not even be installed
+            if isinstance(e, TopicNotFound) or (not WIKIPEDIA_API_URL and isinstance(e, wikipedia.exceptions.PageError)):
+                self.speak_emotionally(f"Sorry, I couldn't find anything on Wikipedia about {topic}.", "worry")
+            else:
+                self.speak_emotionally(f"An error occurred while accessing Wikipedia: {e}", "worry")
+
+    def answer_question(self, question, topic):
+        """Speaks the first good answer from the caches, Wikipedia or Gemini (see AnswerRacer)."""
+        result = self.racer.race(topic, question, checkpoint=self.checkpoint)
+        if result is None:
+            self.speak_emotionally(f"Sorry, I couldn't find a good answer about {topic}.", "worry")
+            return
+        self.tracer.record(f"answer_{result.source}", result.latency)
+        answer = f"According to Wikipedia: {result.text}" if result.origin == "wikipedia" else result.text
+        self.memory.add_exchange(question, answer)
+        self.speak_emotionally(answer)
+
+    def _local_answer(self, topic):
+        entry = self.knowledge.lookup(topic)
+        return ("wikipedia", entry.summary) if entry and AnswerRacer.relevant(topic, entry.title) else None
+
+    def _wikipedia_answer(self, topic, question):
+        entry = self.knowledge.get(topic)
+        return entry.summary if AnswerRacer.relevant(topic, entry.title) else None
+
+    def _gemini_answer(self, topic, question):
+        if not GEMINI_API_KEY:
+            return None
+        response = self._get_gemini_model().generate_content(
+            contents=self.memory.contents(f"{question}? Answer in two or three sentences."))
+        return response.text
 
     def tell_joke(self):
         """Tells a random joke using the pyjokes library."""
         self.speak_emotionally(pyjokes.get_joke(), "happy")
         
-    def ai_chat(self, prompt, speak_response=True):
+    def _get_gemini_model(self):
+        """Creates the Gemini model (with the system prompt) once and reuses it for every request."""
+        with self._gemini_lock:
+            if self.gemini_model is None:
+                genai.configure(api_key=GEMINI_API_KEY)
+                self.gemini_model = genai.GenerativeModel(
+                    model_name=AI_MODEL_NAME,
+                    system_instruction=AI_SYSTEM_PROMPT 
+                ) 
+            return self.gemini_model
+
+    def ai_chat(self, prompt, speak_response=True, stream=AI_STREAM_REPLIES):
         """
         Uses Google Gemini to generate a response.
+        When speaking with stream=True, each sentence is spoken as soon as it has been generated.
         """
         global GEMINI_API_KEY 
         if not GEMINI_API_KEY:
@@ -428,18 +3673,17 @@ class JarvisApp:
             return error_msg
             
         try:
-            # self.speak("Getting a quick response from Gemini...")
-            
-            system_prompt = "You are a helpful, brief, and concise voice assistant named Jarvis. Acting like best friend . My name is Tanmay"
-            
-            model = genai.GenerativeModel(
-                model_name="gemini-1.5-flash", # Using 1.5-flash for speed
-                system_instruction=system_prompt 
-            ) 
+            model = self._get_gemini_model()
+
+            if speak_response and stream:
+                self._stream_ai_reply(model, prompt)
+                return None
             
-            response = model.generate_content(
-                contents=[prompt]
-            )
+            with self.tracer.stage("ai_request"):
+                response = model.generate_content(
+                    contents=self.memory.contents(prompt)
+                )
+            self.memory.add_exchange(prompt, response.text)
             
             if speak_response:
                 self.speak_emotionally(response.text)
@@ -451,133 +3695,448 @@ class JarvisApp:
             error_msg = f"An error occurred with the Gemini API: {e}. Please check your internet connection and API key."
             self.speak_emotionally(error_msg, "worry")
             return error_msg
+
+    def _stream_ai_reply(self, model, prompt):
+        """Streams a Gemini reply and queues every finished sentence to speech. stop_speech() cancels the stream."""
+        self.ai_stream_cancel.clear()
+        started = perf_counter()
+        response = model.generate_content(contents=self.memory.contents(prompt), stream=True)
+
+        pending = ""
+        reply = []
+        first_sentence = True
+        for chunk in response:
+            if self.ai_stream_cancel.is_set():
+                self.update_log("Jarvis: AI reply canceled.")
+                return
+            self.checkpoint()
+            if first_sentence and not pending:
+                self.tracer.record("ai_first_chunk", perf_counter() - started)
+            pending += chunk.text
+            reply.append(chunk.text)
+            *sentences, pending = SENTENCE_END.split(pending)
+            for sentence in sentences:
+                # The first sentence interrupts whatever was playing, the rest queue up behind it
+                self.speak_emotionally(sentence, interrupt=first_sentence)
+                first_sentence = False
+
+        if self.ai_stream_cancel.is_set():
+            return
+        if pending.strip():
+            self.speak_emotionally(pending.strip(), interrupt=first_sentence)
+        self.memory.add_exchange(prompt, "".join(reply).strip())
+
+    def _summarize_conversation(self, summary, max_tokens):
+        """ConversationMemory summarizer: asks Gemini to compress the rolling summary."""
+        if not GEMINI_API_KEY:
+            return None
+        response = self._get_gemini_model().generate_content(contents=[
+            f"Rewrite this summary of our conversation in at most {max_tokens * 3 // 4} words. "
+            f"Keep names, facts and anything still unresolved. Reply with the summary only.\n\n{summary}"
+        ])
+        return response.text
             
+    # --- Command Registry ---
+    def _build_router(self):
+        """Registers every voice command. Which one wins when several match is decided by IntentRouter.match."""
+        router = IntentRouter()
+
+        # --- Interrupt Command ---
+        router.register("cancel", ["cancel", "stop talking", "interrupt"], self._cmd_cancel, anchored=True)
+
+        # --- Volume Controls ---
+        router.register("volume_set", ["set volume to {level}", "set the volume to {level}", "volume to {level}",
+                                       "change the volume to {level}"], self._cmd_volume_set)
+        router.register("volume_step", ["volume up by {amount}", "turn up the volume by {amount}",
+                                        "increase the volume by {amount}", "volume down by {amount}",
+                                        "turn down the volume by {amount}", "decrease the volume by {amount}",
+                                        "lower the volume by {amount}"], self._cmd_volume_step)
+        router.register("volume_up", ["volume up", "turn up the volume"], lambda m: self.control_volume("increase"))
+        router.register("volume_down", ["volume down", "turn down the volume"], lambda m: self.control_volume("decrease"))
+        router.register("unmute", ["unmute"], lambda m: self.control_volume("unmute"), anchored=True)
+        router.register("mute", ["mute", "silence"], lambda m: self.control_volume("mute"), anchored=True)
+
+        # --- Navigation & Searching ---
+        router.register("open_youtube", ["open youtube"], self._cmd_open_youtube)
+        router.register("search_google", ["search google for {topic}"], lambda m: self.search_google(m.slots["topic"]))
+        router.register("open_gmail", ["open gmail"], self._cmd_open_gmail)
+        router.register("news", ["what's the news", "read the news"], lambda m: self.get_news_headlines())
+        router.register("open_app", ["open {name}", "start {name}"], self._cmd_open_app, anchored=True)
+
+        # --- Information and Fun Commands ---
+        router.register("wikipedia", ["wikipedia {topic}"], self._cmd_wikipedia)
+        router.register("joke", ["joke", "jokes"], lambda m: self.tell_joke())
+        router.register("time", ["what time", "tell me the time", "current time"], self._cmd_time, anchored=True)
+        router.register("time", ["what's the time", "what is the time", "the time"], self._cmd_time, exact=True)
+        # Entity questions only; open "what is ..." questions are left to the AI chat
+        router.register("knowledge", ["tell me about {topic}", "who is {topic}", "who was {topic}",
+                                      "what do you know about {topic}"], self._cmd_knowledge,
+                        anchored=True, slot_pattern=ENTITY_TOPIC)
+
+        # --- Control Commands ---
+        router.register("forget", ["forget our conversation", "forget the conversation", "clear the conversation"], self._cmd_forget)
+        router.register("exit", ["exit", "quit"], self._cmd_exit)
+        return router
+
+    def _cmd_cancel(self, match):
+        self.stop_speech()
+        self.speak("Command canceled. What's next?", SpeechWorker.PRIORITY_HIGH)
+
+    def _cmd_open_youtube(self, match):
+        self.speak("Opening YouTube")
+        webbrowser.open("https://youtube.com")
+
+    def _cmd_open_gmail(self, match):
+        self.speak("Opening Gmail")
+        webbrowser.open("https://mail.google.com/")
+
+    def _cmd_open_app(self, match):
+        if match.slots["name"]:
+            self.open_software(match.slots["name"])
+
+    def _cmd_wikipedia(self, match):
+        if match.slots["topic"]:
+            self.get_wikipedia_summary(match.slots["topic"])
+
+    def _cmd_knowledge(self, match):
+        topic = match.slots["topic"]
+        if topic:
+            self.answer_question(match.phrase.replace("{topic}", topic), topic)
+
+    def _cmd_time(self, match):
+        current_time = datetime.datetime.now().strftime("%I:%M %p")
+        self.speak(f"The current time is {current_time}")
+
+    def _cmd_forget(self, match):
+        self.memory.clear()
+        self.speak("Okay, I've forgotten our conversation.")
+
+    def _cmd_exit(self, match):
+        self.speak("Goodbye, sir! Have a great day.")
+        self.stop_jarvis_event.set() # Not stop(): that would cancel the goodbye before it is spoken
+
+
     # --- Main Jarvis Loop ---
-    def run_jarvis(self):
-        """The main loop that listens for and processes commands."""
+    def run(self):
+        """The main loop that listens for and processes commands. Blocks until stopped or the input runs out."""
+        self._running = True
+        self._announced_listening = False
         hour = datetime.datetime.now().hour
         greeting = "Good Morning sir!" if 0 <= hour < 12 else ("Good Afternoon sir!" if 12 <= hour < 18 else "Good Evening sir!")
-        
+
         self.speak_emotionally(f"{greeting} I am Jarvis. How can I assist you today?", "excited")
 
-        self.animate_status_pulse() 
+        if self.browser.should_prewarm_at_startup():
+            self.browser.prewarm() # Web searches are likely, so have Chrome ready before they come
+        self.news.start()
+
+        self.set_status("idle")
 
         while not self.stop_jarvis_event.is_set():
             query = self.take_command()
 
             if query in ["None", "stop"]:
                 continue
-            
-            # --- NEW: INTERRUPT COMMAND ---
-            if "cancel" in query or "stop talking" in query or "interrupt" in query:
-                self.stop_speech()
-                self.speak("Command canceled. What's next?")
-                continue # Go back to the top of the loop to listen again
-            
-            # --- Volume Controls ---
-            elif "volume up" in query or "turn up the volume" in query:
-                self.control_volume("increase")
-            elif "volume down" in query or "turn down the volume" in query:
-                self.control_volume("decrease")
-            elif "mute" in query or "silence" in query:
-                self.control_volume("mute")
-            elif "unmute" in query:
-                self.control_volume("unmute")
-            
-            # --- Navigation & Searching ---
-            elif "open youtube" in query:
-                self.speak("Opening YouTube")
-                webbrowser.open("https://youtube.com")
-            
-            elif "search google for" in query:
-                topic = query.replace("search google for", "").strip()
-                self.search_google(topic)
-                
-            elif "open gmail" in query:
-                self.speak("Opening Gmail")
-                webbrowser.open("https://mail.google.com/")
-            
-            elif "what's the news" in query or "read the news" in query:
-                self.get_news_headlines()
-                
-            elif query.startswith("open ") or query.startswith("start "):
-                 query=query.replace("open "," ")
-                 query=query.replace(" start " ," ")
-                 query=query.replace("jarvis " ," ")
-                 speak('launching... sir!!')
-                 pyautogui.press("win")
-                 sleep(1)
-                 pyautogui.write(query)
-                 sleep(1)
-                 pyautogui.press("enter")
-                 pass
-            # --- Information and Fun Commands ---
-            elif "wikipedia" in query:
-                topic = query.split("wikipedia", 1)[-1].strip()
-                if topic:
-                    self.get_wikipedia_summary(topic)
-            elif "joke" in query:
-                self.tell_joke()
-            elif "time" in query:
-                current_time = datetime.datetime.now().strftime("%I:%M %p")
-                self.speak(f"The current time is {current_time}")
-
-           
-
-            # --- Control Commands ---
-            elif "exit" in query or "quit" in query:
-                self.speak("Goodbye, sir! Have a great day.")
-                self.stop_jarvis()
-                break
-                
+            self.emit("command", query)
+
+            # --- Registered Commands (see _build_router) ---
+            with self.tracer.stage("dispatch"):
+                match = self.router.match(query)
+            if match:
+                if match.intent in BROWSER_INTENTS:
+                    self.browser.prewarm() # Chrome starts while the command waits for a worker
+                self._run_command(match.intent, lambda match=match: self.router.handler(match.intent)(match))
+
             # --- General Query (Fallback to AI) ---
             # Updated logic to better catch general queries
             elif len(query.split()) > 2 or not any(kw in query for kw in ["open", "search", "wikipedia", "news", "volume", "mute", "joke", "time"]):
-                reply = self.ai_chat(query, speak_response=False)
-                if reply:
-                    self.speak_emotionally(reply) 
-            
+                self._run_command("ai_chat", lambda query=query: self.ai_chat(query))
+
             else:
                 # This fallback might be reached less often with the improved logic above
-                self.speak_emotionally("I'm not sure how to handle that command. Please be more specific.", "worry")
+                self._run_command("unknown", lambda: self.speak_emotionally("I'm not sure how to handle that command. Please be more specific.", "worry"))
 
 
-        self.stop_status_pulse() 
+        self.set_status("off")
+        self.input.stop()
         self.close_browser()
-        self.root.after(0, self.reset_gui)
+        self.news.stop()
+        self.tracer.close()
+        if self.speech:
+            logging.info(f"Speech worker stats: {self.speech.stats()}")
+        self._running = False
+        self.emit("stopped")
 
-    def start_jarvis_thread(self):
-        """Starts the Jarvis main loop in a separate thread to keep the GUI responsive."""
-        self.start_btn.configure(state="disabled", text="Initializing...") 
-        self.stop_btn.configure(state="normal")
+    def _run_command(self, intent, handler):
+        """
+        Hands a handler to the executor (inline for fast intents, on the pool for slow ones).
+        The turn's handler time is recorded on whichever thread runs it. The turn ends when
+        its replies are released, which for a reply held behind an earlier command is later.
+        """
+        self.tracer.set_intent(intent)
+        turn = self.tracer.current_turn()
+
+        def traced():
+            self.tracer.set_current(turn)
+            with self.tracer.stage("handler"):
+                handler()
+
+        self.executor.run(intent, traced, on_released=lambda: self.tracer.end_turn(turn))
+
+    def _on_command_timeout(self, task):
+        self.speak_emotionally("Sorry, that is taking too long, so I stopped it.", "worry")
+
+    def start(self):
+        """Runs the main loop on a background thread (used by the GUI)."""
         self.stop_jarvis_event.clear()
-        self.jarvis_thread = threading.Thread(target=self.run_jarvis, daemon=True)
+        self.jarvis_thread = threading.Thread(target=self.run, daemon=True)
         self.jarvis_thread.start()
 
-    def stop_jarvis(self):
-        """Stops the Jarvis thread safely."""
+    def is_running(self):
+        return self._running
+
+    def stop(self):
+        """Asks the main loop to finish after the current turn and silences any speech."""
         self.stop_speech() # Ensure all speech stops
-        if self.jarvis_thread and self.jarvis_thread.is_alive():
+        if self._running:
             self.update_log("Stopping Jarvis...")
             self.stop_jarvis_event.set()
+
+        self.set_status("off")
+
+    def shutdown(self, wait_for_speech=0, join_timeout=6):
+        """
+        Stops the engine and releases its workers. wait_for_speech gives queued replies time to finish first;
+        join_timeout is how long to wait for the main loop thread.
+        """
+        if wait_for_speech and self.speech:
+            self.speech.wait_idle(wait_for_speech)
+        self.stop()
+        if self.jarvis_thread and self.jarvis_thread is not threading.current_thread():
+            self.jarvis_thread.join(timeout=join_timeout)
+        self.executor.shutdown()
+        self.racer.shutdown()
+        if self.speech:
+            self.speech.shutdown()
+        self.knowledge.close()
+
+
+# --- GUI Front End ---
+class JarvisApp:
+    """Desktop window for a JarvisEngine: Start/Stop buttons, status light and the log."""
+    CLOSE_TIMEOUT = 6 # Seconds the closing window waits for the engine thread to finish
+    CLOSE_POLL_MS = 50
+
+    def __init__(self, root_widget, engine=None):
+        """Initializes the GUI and attaches it to the engine."""
+        self.root = root_widget
+        self.root.title("AI Voice Assistant")
+        self.root.geometry("900x700")
+
+        # --- Log pipeline: messages are queued and written to the widget in batches ---
+        configure_log_file()
+        self._log_queue = queue.SimpleQueue()
+        self._log_lines = 0
+        self._log_job = None
+
+        self.status = None
+        self.listening_color = "#e74c3c" # Start as Red (Off)
+
+        self.engine = engine or JarvisEngine()
+        self.engine.on("log", self._log_queue.put)
+        self.engine.on("status", lambda state: self.status.set_state(state))
+        self.engine.on("listening", lambda: self._mark_startup("first_listen"))
+        self.engine.on("stopped", lambda: self.root.after(0, self.reset_gui))
+
+        self._setup_gui()
+        self.status.start()
+        self._flush_log()
+
+        # --- Startup Measurements ---
+        self._startup_marks = {}
+        self.root.bind("<Map>", self._on_first_draw, add="+")
+
+    def _mark_startup(self, event):
+        """Records how long after launch a startup milestone was reached (first time only)."""
+        if event in self._startup_marks:
+            return
+        now = time()
+        self._startup_marks[event] = now - LAUNCH_TIME
+        logging.info(f"Startup: {event.replace('_', ' ')} after {(now - LAUNCH_TIME) * 1000:.0f} ms")
+        if STARTUP_BENCH:
+            print(f"STARTUP {event} {now:.6f}", flush=True)
+            if event == "first_listen":
+                self.root.after(0, self.on_closing)
+
+    def _on_first_draw(self, event=None):
+        """Runs when the window is first mapped: warm up likely imports, and auto-start in benchmark mode."""
+        if "first_draw" in self._startup_marks:
+            return
+        self._mark_startup("first_draw")
+        if WARMUP_ENABLED:
+            warm_up(WARMUP_MODULES)
+        if STARTUP_BENCH:
+            self.start_jarvis_thread()
+
+    # --- GUI & ANIMATION METHODS ---
+    def _setup_gui(self):
+        """Creates and configures the graphical user interface."""
+        ctk.set_appearance_mode("dark")
+        ctk.set_default_color_theme("blue") 
+
+        main_frame = ctk.CTkFrame(self.root)
+        main_frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+        title = ctk.CTkLabel(main_frame, text="AI Voice Assistant", font=("Arial", 32, "bold"), text_color="#E0E0E0")
+        title.pack(pady=(20, 10))
+
+        self.status_light = ctk.CTkCanvas(main_frame, width=20, height=20, bg="#2b2b2b", highlightthickness=0)
+        self.status_circle = self.status_light.create_oval(5, 5, 15, 15, fill=self.listening_color, outline=self.listening_color)
+        self.status_light.pack(pady=(0, 10))
+        self.status = StatusLight(self.root, self.status_light, self.status_circle, is_speaking=self.engine.is_speaking)
+
+        self.log_box = ctk.CTkTextbox(main_frame, font=("Consolas", 14), state="disabled", wrap="word", fg_color="#1e1e1e") 
+        self.log_box.pack(fill="both", expand=True, padx=10, pady=10)
+
+        button_frame = ctk.CTkFrame(main_frame)
+        button_frame.pack(pady=20, fill="x", padx=10)
+
+        self.start_btn = ctk.CTkButton(
+            button_frame, text="Start Listening", command=self.start_jarvis_thread, 
+            width=200, height=40, font=("Helvetica", 14, "bold"),
+            fg_color="#2ecc71", hover_color="#27ae60" 
+        )
+        self.start_btn.pack(side="left", expand=True, padx=10)
+
+        self.stop_btn = ctk.CTkButton(
+            button_frame, text="Stop Listening", command=self.stop_jarvis, 
+            width=200, height=40, font=("Helvetica", 14, "bold"), 
+            state="disabled", fg_color="#e74c3c", hover_color="#c0392b"
+        )
+        self.stop_btn.pack(side="right", expand=True, padx=10)
+
+        self.stats_btn = ctk.CTkButton(
+            button_frame, text="Latency Stats", command=self.show_latency_stats, 
+            width=140, height=40, font=("Helvetica", 14, "bold"),
+            fg_color="#34495e", hover_color="#2c3e50"
+        )
+        self.stats_btn.pack(side="right", expand=True, padx=10)
         
-        self.stop_status_pulse() 
-        
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+    def update_log(self, message):
+        """Thread-safe method to update the GUI log box and console. The widget is refreshed in batches by _flush_log."""
+        self.engine.update_log(message)
+
+    def _flush_log(self):
+        """Runs on the GUI thread every LOG_FLUSH_MS: writes queued messages in one insert and trims old lines."""
+        messages = []
+        try:
+            while len(messages) < LOG_MAX_BATCH:
+                messages.append(self._log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if messages:
+            text = "\n".join(messages) + "\n"
+            self.log_box.configure(state="normal")
+            self.log_box.insert("end", text)
+            self._log_lines += text.count("\n")
+            excess = self._log_lines - LOG_MAX_LINES
+            if excess > 0:
+                self.log_box.delete("1.0", f"{excess + 1}.0")
+                self._log_lines -= excess
+            self.log_box.configure(state="disabled")
+            self.log_box.see("end")
+
+        self._log_job = self.root.after(LOG_FLUSH_MS, self._flush_log)
+
+    def show_latency_stats(self):
+        """Writes the rolling per-stage and per-intent latency percentiles to the log."""
+        for line in self.engine.tracer.summary_lines():
+            self.update_log(line)
+        for line in self.engine.racer.summary_lines():
+            self.update_log(line)
+
+    def start_jarvis_thread(self):
+        """Starts the engine's main loop in a separate thread to keep the GUI responsive."""
+        self.start_btn.configure(state="disabled", text="Initializing...")
+        self.stop_btn.configure(state="normal")
+        self.engine.start()
+
+    def stop_jarvis(self):
+        """Stops the engine's main loop safely."""
+        self.engine.stop()
+
     def reset_gui(self):
         """Resets the GUI buttons to their initial state."""
-        self.start_btn.configure(state="normal", text="Start Listening") 
+        self.start_btn.configure(state="normal", text="Start Listening")
         self.stop_btn.configure(state="disabled")
-    
+
     def on_closing(self):
-        """Handles the application closing event."""
-        self.stop_jarvis()
-        sleep(0.5) 
+        """Handles the application closing event. Never blocks the Tk thread, which the engine's "stopped" event still needs."""
+        self.root.withdraw()
+        self.engine.stop()
+        self._close_deadline = perf_counter() + self.CLOSE_TIMEOUT
+        self._finish_closing()
+
+    def _finish_closing(self):
+        """Polls with after() until the engine thread is done (or the timeout passed), then tears everything down."""
+        thread = self.engine.jarvis_thread
+        if thread and thread.is_alive() and perf_counter() < self._close_deadline:
+            self.root.after(self.CLOSE_POLL_MS, self._finish_closing)
+            return
+        self.engine.shutdown(join_timeout=0)
         self.root.destroy()
 
 
+# --- Command Line ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Jarvis voice assistant. Starts the desktop window unless --headless is given.")
+    parser.add_argument("--headless", action="store_true", help="run without the GUI (commands from the microphone, --audio, --text or stdin)")
+    parser.add_argument("--text", nargs="+", metavar="COMMAND", help="commands to run, one per argument (with --headless)")
+    parser.add_argument("--stdin", action="store_true", help="read commands from stdin, one per line (with --headless)")
+    parser.add_argument("--audio", nargs="+", metavar="FILE", help="recorded commands (WAV/AIFF/FLAC) to recognize (with --headless)")
+    parser.add_argument("--no-tts", action="store_true", help="print replies instead of speaking them")
+    parser.add_argument("--audio-out", metavar="DIR", help="write spoken replies to WAV files in DIR instead of the speakers")
+    parser.add_argument("--recognizer", choices=sorted(RECOGNIZER_BACKENDS), default=RECOGNIZER_BACKEND,
+                        help=f"speech recognizer backend (default: {RECOGNIZER_BACKEND})")
+    return parser.parse_args(argv)
+
+
+def run_headless(args):
+    """Runs one engine session in the terminal. Returns when the input ends or the user says exit."""
+    backend = make_recognizer_backend(args.recognizer)
+    if args.text:
+        source = TextInput(args.text)
+    elif args.stdin:
+        source = TextInput(sys.stdin)
+    elif args.audio:
+        source = AudioFileInput(args.audio, backend)
+    else:
+        source = MicrophoneInput(backend=backend)
+
+    if args.audio_out:
+        speech = SpeechWorker(output_dir=args.audio_out)
+    else:
+        speech = not args.no_tts
+    engine = JarvisEngine(input_source=source, speech=speech)
+    engine.on("reply", lambda text: print(f"Jarvis: {text}", flush=True))
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.shutdown(wait_for_speech=30)
+
+
 # --- Main Execution ---
 if __name__ == "__main__":
-    root = ctk.CTk()
-    app = JarvisApp(root)
+    args = parse_args()
+    if args.headless or args.text or args.stdin or args.audio:
+        run_headless(args)
+    else:
+        root = ctk.CTk()
+        app = JarvisApp(root)
 
-    root.mainloop()
+        root.mainloop()
@@ -0,0 +1,154 @@
+"""
+Local stand-ins for the web services Jarvis talks to, for tests and benchmarks.
+
+    from stub_servers import StubNewsServer, StubWikipediaServer
+
+    with StubNewsServer() as server:
+        os.environ["NEWS_API_URL"] = server.news_url
+        ...  # "read the news" now hits 127.0.0.1
+
+    with StubWikipediaServer() as wiki:
+        os.environ["JARVIS_WIKIPEDIA_URL"] = wiki.url  # set before importing main
+
+Each server runs on a background thread, picks a free port, counts the requests
+it receives and honours If-None-Match with a 304, like the real APIs.
+"""
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+DEFAULT_HEADLINES = [
+    "Local stub headline one - Stub News",
+    "Local stub headline two | Reuters",
+    "Local stub headline three",
+]
+
+DEFAULT_ARTICLES = {
+    "Python (programming language)": "Python is a high-level, general-purpose programming language. "
+                                     "Its design philosophy emphasizes code readability. It was created by Guido van Rossum.",
+    "Moon": "The Moon is Earth's only natural satellite. It orbits at an average distance of 384,400 km. "
+            "It is the fifth largest moon in the Solar System.",
+    "Sun": "The Sun is the star at the center of the Solar System. It is a massive, nearly perfect sphere of hot plasma. "
+           "It is by far the most important source of energy for life on Earth.",
+    "Albert Einstein": "Albert Einstein was a German-born theoretical physicist. He developed the theory of relativity. "
+                       "He received the 1921 Nobel Prize in Physics.",
+}
+
+
+class StubServer:
+    """Base class: serves JSON documents returned by `route(path, query)` on 127.0.0.1."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self.not_modified = 0
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def route(self, path, query):
+        """Returns (status, payload) for a request. Override in subclasses."""
+        return 404, {"error": "not found"}
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                if server.latency:
+                    threading.Event().wait(server.latency)
+                parsed = urlparse(self.path)
+                status, payload = server.route(parsed.path, parse_qs(parsed.query))
+                body = json.dumps(payload).encode("utf-8")
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class StubNewsServer(StubServer):
+    """Mimics the News API top-headlines endpoint."""
+
+    def __init__(self, headlines=DEFAULT_HEADLINES, latency=0.0):
+        super().__init__(latency)
+        self.headlines = list(headlines)
+
+    @property
+    def news_url(self):
+        return f"{self.url}/v2/top-headlines"
+
+    def route(self, path, query):
+        if path != "/v2/top-headlines":
+            return 404, {"status": "error", "message": "unknown endpoint"}
+        articles = [{"title": title} for title in self.headlines]
+        return 200, {"status": "ok", "totalResults": len(articles), "articles": articles}
+
+
+class StubWikipediaServer(StubServer):
+    """Mimics the two Wikipedia REST endpoints main.WikipediaRestClient uses: title search and page summary."""
+
+    def __init__(self, articles=DEFAULT_ARTICLES, latency=0.0):
+        super().__init__(latency)
+        self.articles = dict(articles)
+
+    def search(self, query, limit):
+        words = set(query.lower().split())
+        scored = [(len(words & set(title.lower().replace("(", " ").replace(")", " ").split())), title)
+                  for title in self.articles]
+        return [title for score, title in sorted(scored, key=lambda item: -item[0]) if score][:limit]
+
+    def route(self, path, query):
+        if path == "/w/rest.php/v1/search/title":
+            limit = int(query.get("limit", ["10"])[0])
+            titles = self.search(query.get("q", [""])[0], limit)
+            return 200, {"pages": [{"title": title, "key": title.replace(" ", "_")} for title in titles]}
+        prefix = "/api/rest_v1/page/summary/"
+        if path.startswith(prefix):
+            title = unquote(path[len(prefix):]).replace("_", " ")
+            if title in self.articles:
+                return 200, {"title": title, "extract": self.articles[title]}
+            return 404, {"title": "Not found.", "detail": f"Page {title} does not exist"}
+        return 404, {"error": "unknown endpoint"}
+
+
+if __name__ == "__main__":
+    with StubNewsServer() as news, StubWikipediaServer() as wiki:
+        print(f"News stub: NEWS_API_URL={news.news_url}")
+        print(f"Wikipedia stub: JARVIS_WIKIPEDIA_URL={wiki.url}")
+        threading.Event().wait()
@@ -0,0 +1,43 @@
+"""Resampling tests for AudioPreprocessor."""
+import numpy as np
+import pytest
+
+from main import AudioPreprocessor, sr
+
+
+def tone_audio(rate, *frequencies, seconds=1.0):
+    t = np.arange(int(rate * seconds)) / rate
+    samples = sum(np.sin(2 * np.pi * f * t) for f in frequencies) * 0.3
+    return sr.AudioData((samples * 32767).astype("<i2").tobytes(), rate, 2)
+
+
+def spectrum(audio):
+    samples = np.frombuffer(audio.frame_data, dtype="<i2").astype(np.float64)
+    magnitude = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+    return magnitude, np.fft.rfftfreq(len(samples), 1 / audio.sample_rate)
+
+
+def level_at(magnitude, freqs, frequency):
+    return magnitude[np.argmin(np.abs(freqs - frequency))]
+
+
+@pytest.mark.parametrize("rate", [22050, 24000, 44100, 48000])
+def test_tones_above_8khz_do_not_alias_into_speech(rate):
+    # 11 kHz folds to 5 kHz at 16 kHz unless it is filtered out first
+    out = AudioPreprocessor(target_rate=16000)(tone_audio(rate, 1000, 11000))
+    assert out.sample_rate == 16000
+    magnitude, freqs = spectrum(out)
+    assert level_at(magnitude, freqs, 5000) < level_at(magnitude, freqs, 1000) / 100
+
+
+def test_speech_band_is_kept():
+    out = AudioPreprocessor(target_rate=16000)(tone_audio(48000, 1000, 3000))
+    magnitude, freqs = spectrum(out)
+    ratio = level_at(magnitude, freqs, 3000) / level_at(magnitude, freqs, 1000)
+    assert ratio == pytest.approx(1, abs=0.05)
+
+
+def test_filter_is_built_once_per_rate():
+    preprocessor = AudioPreprocessor(target_rate=16000)
+    assert preprocessor.lowpass(48000) is preprocessor.lowpass(48000)
+    assert preprocessor.lowpass(48000).sum() == pytest.approx(1, abs=1e-5)
@@ -0,0 +1,147 @@
+"""Ordering, cancellation and concurrency tests for ReplySequencer and CommandExecutor."""
+import threading
+
+from main import CommandCanceled, CommandExecutor, ReplySequencer
+
+WAIT = 5 # Seconds a test waits on another thread before giving up
+
+
+def test_replies_come_out_in_command_order():
+    replies = ReplySequencer()
+    said = []
+    first, second = replies.open(), replies.open()
+    replies.submit(second, lambda held: said.append(("B", held)))
+    replies.submit(first, lambda held: said.append(("A1", held)))
+    assert said == [("A1", False)] # B is held back until A is done
+    replies.submit(first, lambda held: said.append(("A2", held)))
+    replies.close(first)
+    assert said == [("A1", False), ("A2", False), ("B", True)]
+    replies.submit(second, lambda held: said.append(("B2", held)))
+    assert said[-1] == ("B2", False) # B is the oldest open slot now
+    assert replies.pending() == 1
+
+
+def test_held_replies_of_finished_commands_keep_their_order():
+    replies = ReplySequencer()
+    said = []
+    first, second, third = replies.open(), replies.open(), replies.open()
+    for seq, name in ((third, "C"), (second, "B1"), (second, "B2")):
+        replies.submit(seq, lambda held, name=name: said.append(name))
+    replies.close(third)
+    replies.close(second)
+    assert said == []
+    replies.close(first)
+    assert said == ["B1", "B2", "C"]
+
+
+def test_discarded_slot_drops_its_replies():
+    replies = ReplySequencer()
+    said = []
+    first, second = replies.open(), replies.open()
+    replies.submit(second, lambda held: said.append("B"))
+    replies.close(second, discard=True)
+    assert not replies.submit(second, lambda held: said.append("late"))
+    replies.close(first)
+    assert said == []
+
+
+def test_on_released_runs_after_the_replies():
+    replies = ReplySequencer()
+    events = []
+    first = replies.open()
+    second = replies.open(on_released=lambda: events.append("released"))
+    replies.submit(second, lambda held: events.append("reply"))
+    replies.close(second)
+    assert events == []
+    replies.close(first)
+    assert events == ["reply", "released"]
+
+
+def test_inline_replies_wait_for_an_earlier_background_command():
+    executor = CommandExecutor(workers=2, intents={"slow": (1, WAIT)})
+    said = []
+    go = threading.Event()
+
+    def slow():
+        go.wait(WAIT)
+        executor.replies.submit(executor.current().seq, lambda held: said.append("slow"))
+
+    def fast():
+        executor.replies.submit(executor.current().seq, lambda held: said.append("fast"))
+
+    executor.run("slow", slow)
+    executor.run("fast", fast)
+    assert said == []
+    go.set()
+    assert executor.wait_idle(WAIT)
+    assert said == ["slow", "fast"]
+    assert executor.completed == 2
+
+
+def test_intent_over_its_limit_does_not_block_other_intents():
+    executor = CommandExecutor(workers=2, intents={"chat": (1, WAIT), "news": (1, WAIT)})
+    release = threading.Event()
+    news_ran = threading.Event()
+    chats = []
+
+    def chat(n):
+        chats.append(n)
+        release.wait(WAIT)
+
+    for n in range(3):
+        executor.run("chat", lambda n=n: chat(n))
+    executor.run("news", news_ran.set)
+    # Only one chat holds a worker; the queued ones must leave the second worker to news
+    assert news_ran.wait(WAIT)
+    assert chats == [0]
+    release.set()
+    assert executor.wait_idle(WAIT)
+    assert chats == [0, 1, 2]
+    executor.shutdown()
+
+
+def test_cancel_all_frees_the_slot_of_a_stuck_command():
+    executor = CommandExecutor(workers=2, intents={"chat": (1, WAIT)})
+    stuck = threading.Event()
+    ran = threading.Event()
+    executor.run("chat", lambda: stuck.wait(WAIT)) # Ignores its CancelToken, like a blocking request
+    assert executor.cancel_all() == 1
+    executor.run("chat", ran.set)
+    assert ran.wait(WAIT)
+    stuck.set()
+    executor.shutdown()
+
+
+def test_queued_commands_are_canceled_without_running():
+    executor = CommandExecutor(workers=2, intents={"chat": (1, WAIT)})
+    release = threading.Event()
+    ran = []
+    executor.run("chat", lambda: release.wait(WAIT))
+    executor.run("chat", lambda: ran.append("queued"))
+    assert executor.cancel_all() == 2
+    release.set()
+    assert executor.wait_idle(WAIT)
+    assert ran == []
+    executor.shutdown()
+
+
+def test_timeout_gives_a_last_word_then_cancels():
+    timed_out = []
+    executor = CommandExecutor(workers=1, intents={"slow": (1, 0.1)}, on_timeout=lambda task: timed_out.append(task.intent))
+    canceled = threading.Event()
+
+    def slow():
+        while True:
+            try:
+                executor.checkpoint()
+            except CommandCanceled:
+                canceled.set()
+                raise
+            threading.Event().wait(0.01)
+
+    executor.run("slow", slow)
+    assert canceled.wait(WAIT)
+    assert executor.wait_idle(WAIT)
+    assert timed_out == ["slow"]
+    assert (executor.timed_out, executor.canceled) == (1, 1)
+    executor.shutdown()
@@ -0,0 +1,71 @@
+"""HttpClient cache tests against the local News API stand-in (stub_servers.py)."""
+import pytest
+import requests
+
+from main import HttpClient
+from stub_servers import StubNewsServer
+
+
+@pytest.fixture
+def server():
+    with StubNewsServer(headlines=["First", "Second"]) as server:
+        yield server
+
+
+def titles(data):
+    return [article["title"] for article in data["articles"]]
+
+
+def test_fresh_copy_is_served_without_a_request(server):
+    client = HttpClient(ttl=60)
+    assert titles(client.get_json(server.news_url)) == ["First", "Second"]
+    assert titles(client.get_json(server.news_url)) == ["First", "Second"]
+    assert server.requests == 1
+    assert (client.fetched, client.hits) == (1, 1)
+
+
+def test_stale_copy_is_revalidated_with_its_etag(server):
+    client = HttpClient(ttl=0)
+    first = client.get_json(server.news_url)
+    assert client.get_json(server.news_url) == first
+    assert (server.requests, server.not_modified) == (2, 1)
+    assert client.revalidated == 1
+
+
+def test_changed_content_replaces_the_stale_copy(server):
+    client = HttpClient(ttl=0)
+    client.get_json(server.news_url)
+    server.headlines = ["Breaking"]
+    assert titles(client.get_json(server.news_url)) == ["Breaking"]
+    assert (server.not_modified, client.fetched) == (0, 2)
+
+
+def test_force_skips_a_fresh_copy(server):
+    client = HttpClient(ttl=60)
+    client.get_json(server.news_url)
+    client.get_json(server.news_url, force=True)
+    assert server.requests == 2
+
+
+def test_falls_back_to_the_last_good_copy_when_unreachable():
+    client = HttpClient(ttl=0, timeout=1)
+    with StubNewsServer(headlines=["Cached"]) as server:
+        url = server.news_url
+        client.get_json(url)
+    assert titles(client.get_json(url)) == ["Cached"]
+
+
+def test_unreachable_without_a_copy_raises():
+    with StubNewsServer() as server:
+        url = server.news_url
+    with pytest.raises(requests.exceptions.RequestException):
+        HttpClient(timeout=1).get_json(url)
+
+
+def test_cache_keeps_the_most_recently_used_responses(server):
+    client = HttpClient(ttl=60, cache_size=2)
+    for page in (1, 2, 1, 3):
+        client.get_json(server.news_url, params={"page": page})
+    assert client.cached(server.news_url, {"page": 1}) is not None
+    assert client.cached(server.news_url, {"page": 2}) is None
+    assert client.cached(server.news_url, {"page": 3}) is not None
@@ -0,0 +1,117 @@
+"""Routing tests for IntentRouter and the command table built by JarvisEngine."""
+import re
+from unittest import mock
+
+import pytest
+
+from main import IntentRouter, JarvisEngine
+
+
+@pytest.fixture(scope="module")
+def router():
+    # The handlers are never called here, so a Mock stands in for the engine
+    return JarvisEngine._build_router(mock.Mock())
+
+
+@pytest.mark.parametrize("query, intent, slots", [
+    # Words of a short command inside a longer request must not hijack it
+    ("tell me about the time machine", "knowledge", {"topic": "the time machine"}),
+    ("search google for mute button", "search_google", {"topic": "mute button"}),
+    ("wikipedia the silence of the lambs", "wikipedia", {"topic": "the silence of the lambs"}),
+    ("tell me a joke about mute people", "joke", {}),
+    # The short commands themselves still work
+    ("what time is it", "time", {}),
+    ("jarvis what's the time", "time", {}),
+    ("what is the time", "time", {}),
+    ("mute", "mute", {}),
+    ("jarvis mute the system", "mute", {}),
+    ("silence", "mute", {}),
+    ("unmute", "unmute", {}),
+    ("cancel", "cancel", {}),
+    ("stop talking", "cancel", {}),
+    ("please stop talking", "cancel", {}),
+    ("hey jarvis stop talking", "cancel", {}),
+    ("okay cancel", "cancel", {}),
+    ("please mute", "mute", {}),
+    ("open youtube", "open_youtube", {}),
+    ("open visual studio code", "open_app", {"name": "visual studio code"}),
+    ("turn up the volume", "volume_up", {}),
+    ("turn up the volume by 20", "volume_step", {"amount": "20"}),
+    ("set volume to 30 percent", "volume_set", {"level": "30 percent"}),
+    ("what's the news", "news", {}),
+    ("who is albert einstein", "knowledge", {"topic": "albert einstein"}),
+    ("jarvis who was ada lovelace", "knowledge", {"topic": "ada lovelace"}),
+    ("who is king charles", "knowledge", {"topic": "king charles"}),
+    ("what do you know about black holes", "knowledge", {"topic": "black holes"}),
+])
+def test_command_table(router, query, intent, slots):
+    match = router.match(query)
+    assert match is not None
+    assert (match.intent, match.slots) == (intent, slots)
+
+
+@pytest.mark.parametrize("query", [
+    "explain how rainbows form",
+    "what is the time complexity of quicksort",
+    "what's the time complexity of a hash lookup",
+    "what is the largest moon in the solar system",
+    # Not questions about an entity
+    "guess who is the new president",
+    "who is coming to dinner tonight",
+    "who was calling me",
+    "tell me about it",
+    "i wonder who is there",
+])
+def test_unmatched_query_falls_through_to_ai_chat(router, query):
+    assert router.match(query) is None
+
+
+def test_earliest_match_wins_over_registration_order():
+    router = IntentRouter()
+    router.register("mute", ["mute"])
+    router.register("search", ["search for {topic}"])
+    assert router.match("search for mute").intent == "search"
+    assert router.match("mute the search for now").intent == "mute"
+
+
+def test_longest_match_wins_at_same_position():
+    router = IntentRouter()
+    router.register("volume_up", ["volume up"])
+    router.register("volume_step", ["volume up by {amount}"])
+    assert router.match("volume up").intent == "volume_up"
+    assert router.match("volume up by ten").slots == {"amount": "ten"}
+
+
+def test_registration_order_breaks_ties():
+    router = IntentRouter()
+    router.register("first", ["open youtube"])
+    router.register("second", ["open {name}"])
+    assert router.match("open youtube").intent == "first"
+    assert router.match("open gmail").intent == "second"
+
+
+def test_anchored_phrase_only_matches_at_start():
+    router = IntentRouter()
+    router.register("mute", ["mute"], anchored=True)
+    assert router.match("jarvis mute").intent == "mute"
+    assert router.match("tell me about mute swans") is None
+
+
+def test_exact_phrase_must_be_the_whole_query():
+    router = IntentRouter()
+    router.register("time", ["what is the time"], exact=True)
+    assert router.match("jarvis what is the time").intent == "time"
+    assert router.match("what is the time complexity") is None
+
+
+def test_slot_pattern_must_match_the_whole_slot():
+    router = IntentRouter()
+    router.register("open", ["open {name}"], slot_pattern=re.compile(r"[a-z]+"))
+    assert router.match("open gmail").slots == {"name": "gmail"}
+    assert router.match("open the pod bay doors") is None
+
+
+def test_whole_words_only():
+    router = IntentRouter()
+    router.register("mute", ["mute"])
+    assert router.match("unmute") is None
@@ -0,0 +1,96 @@
+"""Volume commands against FakeVolumeBackend, so no real mixer is needed."""
+from unittest import mock
+
+import pytest
+
+from main import FakeVolumeBackend, JarvisEngine, VolumeControl, parse_level
+
+
+@pytest.fixture
+def backend():
+    return FakeVolumeBackend(level=50)
+
+
+@pytest.fixture
+def engine(backend):
+    # Only the volume path is exercised: replies are recorded instead of spoken
+    engine = object.__new__(JarvisEngine)
+    engine._volume = VolumeControl(backend)
+    engine.speak = mock.Mock()
+    engine.speak_emotionally = mock.Mock()
+    engine.update_log = mock.Mock()
+    engine.router = engine._build_router()
+    return engine
+
+
+def say(engine, query):
+    match = engine.router.match(query)
+    engine.router.handler(match.intent)(match)
+
+
+@pytest.mark.parametrize("text, level", [
+    ("50%", 50),
+    ("30 percent", 30),
+    ("fifty", 50),
+    ("seventy-five", 75),
+    ("one hundred", 100),
+    ("half", 50),
+    ("max", 100),
+    ("loud", None),
+])
+def test_parse_level(text, level):
+    assert parse_level(text) == level
+
+
+def test_set_volume_to_fifty(engine, backend):
+    backend.level = 20
+    say(engine, "set volume to fifty")
+    assert backend.level == 50
+    engine.speak.assert_called_with("Volume set to 50 percent.")
+
+
+def test_set_volume_without_a_level_asks_again(engine, backend):
+    say(engine, "set volume to loud")
+    assert backend.calls == 0
+    engine.speak_emotionally.assert_called_once()
+
+
+@pytest.mark.parametrize("start, query, level", [
+    (95, "turn up the volume", 100),
+    (5, "turn down the volume", 0),
+    (50, "turn up the volume by 20", 70),
+    (50, "lower the volume by thirty", 20),
+    (90, "volume up by 50", 100),
+])
+def test_steps_are_clamped(engine, backend, start, query, level):
+    backend.level = start
+    say(engine, query)
+    assert backend.level == level
+
+
+def test_unmute_never_toggles(engine, backend):
+    say(engine, "unmute")
+    assert backend.muted is False
+    say(engine, "mute")
+    say(engine, "mute")
+    assert backend.muted is True
+    say(engine, "unmute")
+    say(engine, "unmute")
+    assert backend.muted is False
+
+
+def test_one_mixer_call_per_command(engine, backend):
+    engine.volume.level() # Fills the cache, as the first command after a restart would
+    backend.calls = 0
+    for query in ("set volume to thirty", "turn up the volume", "turn down the volume by 5", "mute", "unmute"):
+        say(engine, query)
+    assert backend.calls == 5
+    assert backend.level == 35
+
+
+def test_step_reads_the_mixer_once_the_cache_expires(backend):
+    volume = VolumeControl(backend, cache_seconds=30)
+    volume.set(40)
+    backend.level = 80 # Changed outside Jarvis
+    volume._checked -= 60
+    assert volume.step(10) == 90